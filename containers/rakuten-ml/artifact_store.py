@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Content-addressed artifact store for Rakuten training outputs
+Artifacts are stored once per volume under .artifact_store/objects/<sha256>; the familiar file
+names (the_best_model.pkl, vectorizer_<ts>.pkl, ...) are hard links to those objects, so
+identical artifacts share one copy. Refs ("latest", "champion") name the files in use, and
+garbage collection removes old per-run snapshots and objects nothing links to anymore.
+Files in the store are never written in place: writers always replace them with a new link.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import time
+from datetime import datetime
+
+STORE_DIRNAME = '.artifact_store'
+
+# Per-run snapshots older than this, and not named by a ref, are garbage collected
+ARTIFACT_RETENTION_DAYS = float(os.environ.get('ARTIFACT_RETENTION_DAYS', '7'))
+
+# Per-run files carry a _YYYYmmdd_HHMMSS timestamp in their own or their directory's name
+SNAPSHOT_PATTERN = re.compile(r'_(\d{8}_\d{6})')
+
+HASH_CHUNK_BYTES = 1 << 20
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_or_copy(source, target):
+    """Hard link source at target (atomically replacing target); copy if links are not possible"""
+    # Already a link to source: renaming a second link over it would be a no-op that leaves tmp behind
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    tmp_path = f"{target}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+    if os.path.lexists(tmp_path):
+        # target turned into a link to source in the meantime: the rename did nothing
+        os.remove(tmp_path)
+
+def _snapshot_time(relative_path):
+    """
+    When a per-run file was written, from the last timestamp in its path (None if unparseable).
+    Not its mtime: all links of an object share one inode, so that is when the content was first stored.
+    """
+    try:
+        return datetime.strptime(SNAPSHOT_PATTERN.findall(relative_path)[-1], "%Y%m%d_%H%M%S").timestamp()
+    except (IndexError, ValueError):
+        return None
+
+class ArtifactStore:
+    """Content-addressed objects and named refs for the files of one volume (models/ or processed_data/)"""
+
+    def __init__(self, volume_dir):
+        self.volume_dir = volume_dir
+        self.root = os.path.join(volume_dir, STORE_DIRNAME)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.refs_dir = os.path.join(self.root, 'refs')
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def _put(self, sha256, write):
+        """Create the object with write(tmp_path) unless it already exists"""
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.{os.getpid()}"
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        return sha256
+
+    def put_bytes(self, data):
+        """Store data (bytes or a buffer) as an object; returns the sha256"""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        return self._put(hashlib.sha256(data).hexdigest(), write)
+
+    def save_bytes(self, data, path):
+        """Store data and (re)link path to it; returns the sha256"""
+        sha256 = self.put_bytes(data)
+        _link_or_copy(self.object_path(sha256), path)
+        return sha256
+
+    def save_pickle(self, obj, path):
+        return self.save_bytes(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), path)
+
+    def adopt(self, path):
+        """
+        Move an existing file into the store: it becomes (a link to) the object of its content,
+        sharing the copy another run already stored if there is one. Returns the sha256.
+        """
+        sha256 = _file_sha256(path)
+        object_path = self.object_path(sha256)
+        if os.path.exists(object_path):
+            if not os.path.samefile(object_path, path):
+                _link_or_copy(object_path, path)
+        else:
+            self._put(sha256, lambda tmp_path: _link_or_copy(path, tmp_path))
+        return sha256
+
+    def link(self, sha256, path):
+        """Make path name an object already in the store"""
+        _link_or_copy(self.object_path(sha256), path)
+
+    def set_ref(self, name, artifacts):
+        """Point a ref at {path: sha256}; the files it names are kept by garbage collection"""
+        os.makedirs(self.refs_dir, exist_ok=True)
+        ref_path = os.path.join(self.refs_dir, f'{name}.json')
+        with open(f"{ref_path}.tmp", 'w') as f:
+            json.dump({'updated': datetime.now().isoformat(), 'artifacts': artifacts}, f, indent=2)
+        os.replace(f"{ref_path}.tmp", ref_path)
+
+    def get_ref(self, name):
+        ref_path = os.path.join(self.refs_dir, f'{name}.json')
+        if not os.path.exists(ref_path):
+            return None
+        with open(ref_path, 'r') as f:
+            return json.load(f)
+
+    def _referenced(self):
+        """Paths and objects named by any ref"""
+        paths, objects = set(), set()
+        if os.path.isdir(self.refs_dir):
+            for name in os.listdir(self.refs_dir):
+                if name.endswith('.json'):
+                    ref = self.get_ref(name[:-len('.json')])
+                    for path, sha256 in ref['artifacts'].items():
+                        paths.add(os.path.abspath(path))
+                        objects.add(sha256)
+        return paths, objects
+
+    def collect_garbage(self, retention_days=ARTIFACT_RETENTION_DAYS):
+        """
+        Remove per-run snapshot files older than retention_days that no ref names, then the
+        objects no file links to anymore. Returns (files removed, objects removed, bytes freed).
+        """
+        cutoff = time.time() - retention_days * 86400
+        referenced_paths, referenced_objects = self._referenced()
+        removed_files = removed_objects = freed_bytes = 0
+
+        for dirpath, dirnames, filenames in os.walk(self.volume_dir, topdown=False):
+            if os.path.abspath(dirpath).startswith(os.path.abspath(self.root)):
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                relative_path = os.path.relpath(path, self.volume_dir)
+                if not SNAPSHOT_PATTERN.search(relative_path):
+                    continue
+                written = _snapshot_time(relative_path)
+                if written is None:
+                    written = os.lstat(path).st_mtime
+                if os.path.abspath(path) in referenced_paths or written > cutoff:
+                    continue
+                os.remove(path)
+                removed_files += 1
+            # Snapshot directories (processed_text_<ts>/) go once they are empty
+            if dirpath != self.volume_dir and SNAPSHOT_PATTERN.search(os.path.basename(dirpath)) and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                for sha256 in os.listdir(os.path.join(self.objects_dir, prefix)):
+                    path = os.path.join(self.objects_dir, prefix, sha256)
+                    st = os.stat(path)
+                    # nlink 1: the store holds the only name left
+                    if st.st_nlink == 1 and sha256 not in referenced_objects and st.st_mtime <= cutoff:
+                        os.remove(path)
+                        removed_objects += 1
+                        freed_bytes += st.st_size
+
+        print(f"Artifact store {self.root}: removed {removed_files} snapshot files and "
+              f"{removed_objects} objects ({freed_bytes / 2**20:.1f} MB)")
+        return removed_files, removed_objects, freed_bytes
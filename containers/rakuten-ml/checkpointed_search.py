@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Resumable grid search for Rakuten model training
+Every finished (candidate, fold) score is appended to a checkpoint file keyed by the training
+data snapshot, so a restarted or retried training run only fits what is still missing
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+
+# Parameters that change how fast a fit runs, not its result
+IGNORED_PARAMS = {'n_jobs', 'verbose', 'memory'}
+
+def _stable_repr(value):
+    """Representation of a parameter value that is stable across processes and runs"""
+    if isinstance(value, BaseEstimator):
+        params = {key: param for key, param in value.get_params(deep=False).items() if key not in IGNORED_PARAMS}
+        inner = ', '.join(f"{key}={_stable_repr(params[key])}" for key in sorted(params))
+        return f"{type(value).__module__}.{type(value).__name__}({inner})"
+    if isinstance(value, dict):
+        return '{' + ', '.join(f"{key!r}: {_stable_repr(value[key])}" for key in sorted(value)) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_stable_repr(item) for item in value) + ']'
+    return repr(value)
+
+def params_hash(params):
+    return hashlib.sha256(_stable_repr({k: v for k, v in params.items() if k.split('__')[-1] not in IGNORED_PARAMS}).encode()).hexdigest()[:16]
+
+def data_snapshot_hash(X, y, n_splits):
+    """Hash of the training texts, labels and fold layout"""
+    digest = hashlib.sha256(f"folds={n_splits};n={len(X)}".encode())
+    for text in X:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(np.ascontiguousarray(np.asarray(y, dtype=np.int64)).tobytes())
+    return digest.hexdigest()[:16]
+
+def _fit_and_score(estimator, params, X, y, train, test, scoring, candidate_hash, fold):
+    """
+    Fit one candidate on one fold; failed fits score NaN like GridSearchCV's error_score and are
+    recorded with status 'failed', so a resumed search runs them again
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        # Parameter values are cloned too: estimators in the grid must not be fitted in place
+        fitted = clone(estimator).set_params(**clone(params, safe=False)).fit(X.iloc[train], y[train])
+        score = float(get_scorer(scoring)(fitted, X.iloc[test], y[test]))
+    except Exception as e:
+        print(f"Fit failed for {params} on fold {fold}: {e}")
+        score, status = float('nan'), 'failed'
+    return {'params_hash': candidate_hash, 'fold': fold, 'score': score, 'status': status,
+            'fit_seconds': time.perf_counter() - start}
+
+class CheckpointedGridSearch:
+    """
+    Exhaustive search over param_grid with stratified K-fold CV, like GridSearchCV(refit=True).
+    Scores are appended to <checkpoint_dir>/<data hash>.jsonl as fits finish; fits already
+    recorded there are skipped unless they failed. Exposes best_params_, best_score_, best_index_,
+    best_estimator_ and cv_results_ (params, split*_test_score, mean_test_score, rank_test_score).
+    """
+
+    def __init__(self, estimator, param_grid, scoring='f1_weighted', cv=3, n_jobs=1, checkpoint_dir='checkpoints', verbose=1):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.checkpoint_dir = checkpoint_dir
+        self.verbose = verbose
+
+    def _load_checkpoint(self, path):
+        """Successful fits already recorded for this data snapshot: {(params hash, fold): score}"""
+        done = {}
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                data = f.read()
+                # Drop a last line cut short by a crash, so new records do not get appended to it
+                f.truncate(data.rfind(b'\n') + 1)
+            for line in data.splitlines(keepends=True):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # Failures may be transient (out of memory, a killed worker): retry them
+                if record.get('status', 'ok') != 'ok' or np.isnan(record['score']):
+                    continue
+                done[(record['params_hash'], record['fold'])] = record['score']
+        return done
+
+    def _remove_stale_checkpoints(self, current_path):
+        for path in glob.glob(os.path.join(self.checkpoint_dir, '*.jsonl')):
+            if path != current_path:
+                os.remove(path)
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        candidates = list(ParameterGrid(self.param_grid))
+        hashes = [params_hash(params) for params in candidates]
+        folds = list(StratifiedKFold(n_splits=self.cv).split(np.zeros(len(y)), y))
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        checkpoint_path = os.path.join(self.checkpoint_dir, f"{data_snapshot_hash(X, y, self.cv)}.jsonl")
+        self._remove_stale_checkpoints(checkpoint_path)
+        scores = self._load_checkpoint(checkpoint_path)
+
+        pending = [
+            (index, fold) for index in range(len(candidates)) for fold in range(self.cv)
+            if (hashes[index], fold) not in scores
+        ]
+        if self.verbose:
+            print(f"Fitting {self.cv} folds for each of {len(candidates)} candidates: "
+                  f"{len(candidates) * self.cv - len(pending)} fits restored from {checkpoint_path}, {len(pending)} to run")
+
+        if pending:
+            tasks = (
+                delayed(_fit_and_score)(self.estimator, candidates[index], X, y, folds[fold][0], folds[fold][1],
+                                        self.scoring, hashes[index], fold)
+                for index, fold in pending
+            )
+            with open(checkpoint_path, 'a') as f:
+                for record in Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(tasks):
+                    f.write(json.dumps(record) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                    scores[(record['params_hash'], record['fold'])] = record['score']
+
+        split_scores = np.array([[scores[(candidate_hash, fold)] for fold in range(self.cv)] for candidate_hash in hashes])
+        mean_scores = split_scores.mean(axis=1)
+        # NaN (failed) candidates rank last; ties go to the first candidate, as in GridSearchCV
+        ranking_scores = np.where(np.isnan(mean_scores), -np.inf, mean_scores)
+        order = np.argsort(-ranking_scores, kind='stable')
+        ranks = np.empty(len(candidates), dtype=np.int64)
+        ranks[order] = np.arange(1, len(candidates) + 1)
+
+        self.cv_results_ = {'params': candidates, 'mean_test_score': mean_scores, 'rank_test_score': ranks}
+        for fold in range(self.cv):
+            self.cv_results_[f'split{fold}_test_score'] = split_scores[:, fold]
+        self.best_index_ = int(order[0])
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = float(mean_scores[self.best_index_])
+
+        if self.verbose:
+            print("Refitting the best candidate on the full training set...")
+        self.best_estimator_ = clone(self.estimator).set_params(**clone(self.best_params_, safe=False)).fit(X, y)
+        return self
@@ -7,6 +7,7 @@ import numpy as np
 from evidently import Report
 from evidently.presets import DataDriftPreset
 from sklearn.preprocessing import LabelEncoder
+from processed_text_store import read_processed_text
 import os
 import json
 import sys
@@ -18,7 +19,7 @@ def get_latest_reference_path(processed_data_dir='processed_data'):
         return None
     with open(latest_meta_path, 'r') as f:
         metadata = json.load(f)
-    ref_path = metadata.get('text_path')  # CSV with processed text
+    ref_path = metadata.get('text_path')  # Parquet dataset (or CSV from older runs) with processed text
     
     # First check if ref_path as is exists (could be absolute)
     if ref_path and os.path.exists(ref_path):
@@ -119,7 +120,7 @@ def main():
         reference_path = './data/train_reference.csv'
 
     print(f"Using reference data from: {reference_path}")
-    ref_df = pd.read_csv(reference_path)
+    ref_df = read_processed_text(reference_path)
 
     print("Simulating new incoming data...")
     current_df = get_data_chunk(ref_df, chunk_size=0.05)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Compiled linear models for Rakuten product classification
+Turns a fitted (Count|Tfidf)Vectorizer + linear classifier pipeline into plain numpy arrays
+and scores them without scikit-learn at serving time
+"""
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+# Version 2 added calibrated (Platt-scaled) linear SVMs, version 3 quantized coefficients;
+# older artifacts still load
+ARTIFACT_FORMAT_VERSION = 3
+SUPPORTED_FORMAT_VERSIONS = (1, 2, 3)
+
+# Storage types for coefficients: int8 uses one scale per decision row (class)
+QUANTIZATION_DTYPES = ('float32', 'float16', 'int8')
+
+# Linear models whose decision_function is coef_ @ x + intercept_
+LINEAR_CLASSIFIERS = ('LogisticRegression', 'LinearSVC')
+
+# Process this many rows at a time so (tokens x classes) intermediates stay small
+SCORING_CHUNK_ROWS = 1000
+
+def _strip_accents_unicode(text):
+    """Same as sklearn.feature_extraction.text.strip_accents_unicode"""
+    try:
+        text.encode("ASCII", errors="strict")
+        return text
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", text)
+        return "".join([c for c in normalized if not unicodedata.combining(c)])
+
+def _strip_accents_ascii(text):
+    """Same as sklearn.feature_extraction.text.strip_accents_ascii"""
+    return unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("ASCII")
+
+def _probability_mode(classifier):
+    """How the fitted classifier turns decision values into probabilities"""
+    n_classes = len(classifier.classes_)
+    if n_classes <= 2:
+        return 'binary_sigmoid'
+    multi_class = getattr(classifier, 'multi_class', 'auto')
+    if multi_class == 'ovr' or (multi_class != 'multinomial' and getattr(classifier, 'solver', None) == 'liblinear'):
+        return 'ovr_sigmoid'
+    return 'softmax'
+
+def _compile_calibrated(classifier):
+    """
+    Decision rows and sigmoid calibration parameters of a CalibratedClassifierCV(method='sigmoid')
+    over linear models. Rows of all calibrated classifiers are stacked; for each row, calibration
+    holds the sigmoid a/b, the probability column it fills and the calibrated classifier it belongs to.
+    Returns None for anything else (isotonic/temperature calibration, non-linear base models).
+    """
+    if getattr(classifier, 'method', None) != 'sigmoid':
+        return None
+    n_classes = len(classifier.classes_)
+    coefs, intercepts, a, b, columns, groups = [], [], [], [], [], []
+    for group, calibrated in enumerate(classifier.calibrated_classifiers_):
+        estimator = calibrated.estimator
+        if type(estimator).__name__ not in LINEAR_CLASSIFIERS:
+            return None
+        if any(type(calibrator).__name__ != '_SigmoidCalibration' for calibrator in calibrated.calibrators):
+            return None
+        n_rows = estimator.coef_.shape[0]
+        # Same column assignment as sklearn's _CalibratedClassifier.predict_proba
+        positions = np.searchsorted(calibrated.classes, estimator.classes_)[:n_rows]
+        if n_classes == 2:
+            positions = positions + 1
+        coefs.append(estimator.coef_)
+        intercepts.append(np.broadcast_to(estimator.intercept_, (n_rows,)))
+        a.extend(float(calibrator.a_) for calibrator in calibrated.calibrators[:n_rows])
+        b.extend(float(calibrator.b_) for calibrator in calibrated.calibrators[:n_rows])
+        columns.extend(positions.tolist())
+        groups.extend([group] * n_rows)
+    return {
+        'coef': np.vstack(coefs),
+        'intercept': np.concatenate(intercepts),
+        'calibration': np.array([a, b, columns, groups], dtype=np.float64),
+    }
+
+def compile_linear_pipeline(pipeline, class_labels):
+    """
+    Extract the arrays needed to reproduce pipeline.predict_proba.
+    class_labels are the original category codes for pipeline.classes_ (label encoder inverse).
+    Returns None if the pipeline is not a word-level vectorizer followed by LogisticRegression
+    or a sigmoid-calibrated linear SVM.
+    """
+    steps = getattr(pipeline, 'steps', None)
+    if not steps or len(steps) != 2:
+        return None
+    vectorizer, classifier = steps[0][1], steps[1][1]
+
+    if type(vectorizer).__name__ not in ('CountVectorizer', 'TfidfVectorizer'):
+        return None
+    if vectorizer.analyzer != 'word' or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None:
+        return None
+    if vectorizer.strip_accents not in (None, 'unicode', 'ascii'):
+        return None
+    if type(classifier).__name__ == 'LogisticRegression':
+        linear = {
+            'coef': classifier.coef_,
+            'intercept': classifier.intercept_,
+            'calibration': np.zeros((4, 0)),
+        }
+        probability = _probability_mode(classifier)
+    elif type(classifier).__name__ == 'CalibratedClassifierCV':
+        linear = _compile_calibrated(classifier)
+        if linear is None:
+            return None
+        probability = 'calibrated_sigmoid'
+    else:
+        return None
+
+    n_features = len(vectorizer.vocabulary_)
+    terms = [None] * n_features
+    for term, index in vectorizer.vocabulary_.items():
+        terms[index] = term
+
+    is_tfidf = type(vectorizer).__name__ == 'TfidfVectorizer'
+    use_idf = is_tfidf and vectorizer.use_idf
+    stop_words = vectorizer.get_stop_words()
+
+    config = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'lowercase': bool(vectorizer.lowercase),
+        'strip_accents': vectorizer.strip_accents,
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'stop_words': sorted(stop_words) if stop_words else None,
+        'binary': bool(vectorizer.binary),
+        'sublinear_tf': bool(is_tfidf and vectorizer.sublinear_tf),
+        'norm': vectorizer.norm if is_tfidf else None,
+        'use_idf': bool(use_idf),
+        'probability': probability,
+        'coef_dtype': 'float32',
+    }
+
+    return {
+        'config': config,
+        'terms': np.array(terms, dtype=str),
+        'idf': np.asarray(vectorizer.idf_, dtype=np.float32) if use_idf else np.zeros(0, dtype=np.float32),
+        # Stored as (n_features, n_rows) so a document's tokens gather contiguous rows
+        'coef': np.ascontiguousarray(np.asarray(linear['coef'], dtype=np.float32).T),
+        'intercept': np.asarray(linear['intercept'], dtype=np.float32),
+        'calibration': linear['calibration'],
+        'coef_scale': np.zeros(0, dtype=np.float32),
+        'classes': np.asarray(class_labels),
+    }
+
+def quantize_compiled(compiled, dtype):
+    """
+    Copy of a float32 compiled model with coefficients stored as float16, or as int8 with a
+    float32 scale per decision row (max |coef| of the row maps to 127). idf goes to float16.
+    """
+    if dtype not in QUANTIZATION_DTYPES:
+        raise ValueError(f"Unknown quantization '{dtype}' (expected one of {QUANTIZATION_DTYPES})")
+    quantized = dict(compiled, config=dict(compiled['config'], coef_dtype=dtype))
+    if dtype == 'float32':
+        return quantized
+    coef = compiled['coef'].astype(np.float32)
+    quantized['idf'] = compiled['idf'].astype(np.float16)
+    if dtype == 'float16':
+        quantized['coef'] = coef.astype(np.float16)
+    else:
+        scale = np.abs(coef).max(axis=0) / 127.0
+        scale[scale == 0.0] = 1.0
+        quantized['coef'] = np.clip(np.rint(coef / scale), -127, 127).astype(np.int8)
+        quantized['coef_scale'] = scale.astype(np.float32)
+    return quantized
+
+def save_linear_artifact(compiled, path):
+    """Write a compiled model to a single .npz file (atomically)"""
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        config=np.array(json.dumps(compiled['config'])),
+        terms=compiled['terms'],
+        idf=compiled['idf'],
+        coef=compiled['coef'],
+        intercept=compiled['intercept'],
+        calibration=compiled['calibration'],
+        coef_scale=compiled['coef_scale'],
+        classes=compiled['classes'],
+    )
+    os.replace(tmp_path, path)
+
+class LinearScorer:
+    """
+    Numpy-only replacement for a fitted vectorizer + LogisticRegression pipeline.
+    predict_proba(texts) matches the sklearn pipeline up to float32 rounding (or the
+    rounding of the quantized coefficients);
+    class_labels holds the original category codes for the probability columns.
+    """
+
+    def __init__(self, compiled):
+        config = compiled['config']
+        self.config = config
+        self.coef = compiled['coef']
+        self.intercept = compiled['intercept'].astype(np.float64)
+        self.idf = compiled['idf'] if config['use_idf'] else None
+        self.calibration = compiled.get('calibration')
+        # int8 coefficients: gathered rows are multiplied back by their per-row scale
+        coef_scale = compiled.get('coef_scale')
+        self.coef_scale = coef_scale.astype(np.float64) if coef_scale is not None and len(coef_scale) else None
+        self.class_labels = compiled['classes']
+        self.classes_ = np.arange(len(self.class_labels))
+        self.vocabulary = {term: index for index, term in enumerate(compiled['terms'].tolist())}
+
+        self._token_regex = re.compile(config['token_pattern'])
+        self._stop_words = frozenset(config['stop_words']) if config['stop_words'] else None
+        self._min_n, self._max_n = config['ngram_range']
+        self._strip_accents = {
+            None: None,
+            'unicode': _strip_accents_unicode,
+            'ascii': _strip_accents_ascii,
+        }[config['strip_accents']]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            compiled = {key: data[key] for key in ('terms', 'idf', 'coef', 'intercept', 'classes')}
+            for key in ('calibration', 'coef_scale'):
+                if key in data:
+                    compiled[key] = data[key]
+            compiled['config'] = json.loads(str(data['config']))
+        if compiled['config']['format_version'] not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported compiled model format: {compiled['config']['format_version']}")
+        return cls(compiled)
+
+    def _analyze(self, text):
+        """Tokens and n-grams exactly as the sklearn word analyzer produces them"""
+        if self.config['lowercase']:
+            text = text.lower()
+        if self._strip_accents is not None:
+            text = self._strip_accents(text)
+        tokens = self._token_regex.findall(text)
+        if self._stop_words is not None:
+            tokens = [t for t in tokens if t not in self._stop_words]
+
+        min_n, max_n = self._min_n, self._max_n
+        if max_n == 1:
+            return tokens
+        original_tokens = tokens
+        if min_n == 1:
+            tokens = list(original_tokens)
+            min_n += 1
+        else:
+            tokens = []
+        for n in range(min_n, min(max_n + 1, len(original_tokens) + 1)):
+            for i in range(len(original_tokens) - n + 1):
+                tokens.append(" ".join(original_tokens[i:i + n]))
+        return tokens
+
+    def _features(self, texts):
+        """Sparse (CSR-style) feature rows: indptr, column indices, values"""
+        vocabulary = self.vocabulary
+        indptr, indices, values = [0], [], []
+        for text in texts:
+            counts = Counter()
+            for token in self._analyze(text):
+                index = vocabulary.get(token)
+                if index is not None:
+                    counts[index] += 1
+            indices.extend(counts.keys())
+            values.extend(counts.values())
+            indptr.append(len(indices))
+
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        if self.config['binary']:
+            values[:] = 1.0
+        if self.config['sublinear_tf']:
+            values = np.log(values) + 1.0
+        if self.idf is not None:
+            values *= self.idf[indices]
+
+        norm = self.config['norm']
+        if norm is not None and len(values):
+            rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+            if norm == 'l2':
+                row_norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+            else:
+                row_norms = np.bincount(rows, weights=np.abs(values), minlength=len(texts))
+            row_norms[row_norms == 0.0] = 1.0
+            values /= row_norms[rows]
+        return indptr, indices, values
+
+    def decision_function(self, texts):
+        scores = np.tile(self.intercept, (len(texts), 1))
+        for start in range(0, len(texts), SCORING_CHUNK_ROWS):
+            chunk = texts[start:start + SCORING_CHUNK_ROWS]
+            indptr, indices, values = self._features(chunk)
+            if not len(values):
+                continue
+            # Weighted sum of the coefficient rows of each document's tokens
+            contributions = self.coef[indices].astype(np.float64) * values[:, None]
+            if self.coef_scale is not None:
+                contributions *= self.coef_scale
+            non_empty = np.diff(indptr) > 0
+            scores[start:start + len(chunk)][non_empty] += np.add.reduceat(contributions, indptr[:-1][non_empty], axis=0)
+        return scores
+
+    def _calibrated_proba(self, scores):
+        """Average of the per-classifier sigmoid-calibrated, normalized probabilities"""
+        a, b, columns, groups = self.calibration
+        columns, groups = columns.astype(np.int64), groups.astype(np.int64)
+        n_classes = len(self.class_labels)
+        calibrated = 1.0 / (1.0 + np.exp(a * scores + b))
+        mean_proba = np.zeros((len(scores), n_classes))
+        n_groups = int(groups.max()) + 1
+        for group in range(n_groups):
+            rows = groups == group
+            proba = np.zeros((len(scores), n_classes))
+            proba[:, columns[rows]] = calibrated[:, rows]
+            if n_classes == 2:
+                proba[:, 0] = 1.0 - proba[:, 1]
+            else:
+                denominator = proba.sum(axis=1, keepdims=True)
+                proba = np.divide(proba, denominator, out=np.full_like(proba, 1.0 / n_classes), where=denominator != 0)
+            proba[(1.0 < proba) & (proba <= 1.0 + 1e-5)] = 1.0
+            mean_proba += proba
+        return mean_proba / n_groups
+
+    def predict_proba(self, texts):
+        scores = self.decision_function(texts)
+        mode = self.config['probability']
+        if mode == 'calibrated_sigmoid':
+            return self._calibrated_proba(scores)
+        if mode == 'softmax':
+            scores -= scores.max(axis=1, keepdims=True)
+            np.exp(scores, out=scores)
+            scores /= scores.sum(axis=1, keepdims=True)
+            return scores
+        probabilities = 1.0 / (1.0 + np.exp(-scores))
+        if mode == 'binary_sigmoid':
+            return np.hstack([1.0 - probabilities, probabilities])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        return self.classes_[np.argmax(self.predict_proba(texts), axis=1)]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Adaptive micro-batching for the prediction API
+Collects concurrent requests for a few milliseconds and scores them in one vectorized call
+"""
+import asyncio
+import inspect
+import time
+from collections import Counter
+
+# Bucket upper bounds for the batch size and queue depth histograms
+HISTOGRAM_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+
+def _bucket(value):
+    """Smallest histogram bucket that holds value ('+Inf' if larger than all of them)"""
+    for bound in HISTOGRAM_BUCKETS:
+        if value <= bound:
+            return str(bound)
+    return '+Inf'
+
+class MicroBatcher:
+    """
+    In-process batching scheduler in front of a batch scoring function.
+
+    Requests are queued with submit(). A background task takes everything already
+    waiting, and - only while the service is under load - keeps collecting for up to
+    max_wait_ms or until max_batch_size items are gathered. The batch is scored with a
+    single call to score_fn(items) (a plain function or a coroutine function) and each
+    result is handed back to its waiting caller.
+    At low load a lone request is dispatched immediately, so it pays no batching delay.
+    Up to max_concurrency batches are scored at once (size it to the inference pool); while
+    all of them are busy, new requests keep queueing and go out together as the next batch.
+    """
+
+    def __init__(self, score_fn, max_batch_size=64, max_wait_ms=5.0, max_concurrency=1):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrency = max_concurrency
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._in_flight = {}
+        self._busy_slots = 0
+        self._max_busy_slots = 0
+        self._last_batch_size = 0
+        self._batch_sizes = Counter()
+        self._queue_depths = Counter()
+        self._batches = 0
+        self._items = 0
+        self._wait_seconds = 0.0
+
+    def start(self):
+        """Start the background batching task (must be called from the running event loop)"""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching task and the batches in flight; their requests and those still queued are failed"""
+        if self._worker is not None:
+            in_flight = dict(self._in_flight)  # Finished tasks remove themselves from _in_flight
+            for task in [self._worker, *in_flight]:
+                task.cancel()
+            for task in [self._worker, *in_flight]:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            for batch in in_flight.values():
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Prediction service is shutting down"))
+            self._in_flight.clear()
+            self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Prediction service is shutting down"))
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        if self._worker is None:
+            raise RuntimeError("MicroBatcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.monotonic()))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first request, then gather a batch"""
+        batch = [await self._queue.get()]
+        self._queue_depths[_bucket(self._queue.qsize() + 1)] += 1
+
+        # Take whatever is already waiting without delay
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        # Only hold the batch open when recent traffic shows requests arriving together
+        if self._last_batch_size > 1 or len(batch) > 1:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+        return batch
+
+    async def _score(self, items):
+        """Score one batch of items"""
+        results = self.score_fn(items)
+        if inspect.isawaitable(results):
+            results = await results
+        return results
+
+    async def _dispatch(self, batch):
+        """Score one batch and resolve its callers' futures, then free its slot"""
+        try:
+            results = await self._score([item for item, _, _ in batch])
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._busy_slots -= 1
+            self._slots.release()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Only collect once a slot is free: while every slot is busy, requests pile up into a bigger batch
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            now = time.monotonic()
+
+            self._last_batch_size = len(batch)
+            self._batch_sizes[_bucket(len(batch))] += 1
+            self._batches += 1
+            self._items += len(batch)
+            self._wait_seconds += sum(now - enqueued for _, _, enqueued in batch)
+
+            self._busy_slots += 1
+            self._max_busy_slots = max(self._max_busy_slots, self._busy_slots)
+            task = loop.create_task(self._dispatch(batch))
+            self._in_flight[task] = batch
+            task.add_done_callback(lambda done: self._in_flight.pop(done, None))
+
+    def stats(self):
+        """Queue depth and batch size histograms plus running totals"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches_in_flight": self._busy_slots,
+            "max_batches_in_flight": self._max_busy_slots,
+            "max_concurrency": self.max_concurrency,
+            "batches_total": self._batches,
+            "items_total": self._items,
+            "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+            "avg_queue_wait_ms": 1000.0 * self._wait_seconds / self._items if self._items else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": 1000.0 * self.max_wait,
+            "batch_size_histogram": {bucket: self._batch_sizes[bucket] for bucket in self._bucket_labels()},
+            "queue_depth_histogram": {bucket: self._queue_depths[bucket] for bucket in self._bucket_labels()},
+        }
+
+    @staticmethod
+    def _bucket_labels():
+        return [str(bound) for bound in HISTOGRAM_BUCKETS] + ['+Inf']
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark for Rakuten model selection
+Measures what serving pays for a fitted pipeline: single-row and batch predict_proba
+latency percentiles, peak memory of a batch and pickled size
+"""
+import pickle
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCHMARK_SINGLE_ROWS = 200
+BENCHMARK_BATCH_SIZE = 256
+BENCHMARK_BATCHES = 20
+
+def _timed_ms(fn, arg):
+    start = time.perf_counter()
+    fn(arg)
+    return (time.perf_counter() - start) * 1000
+
+def benchmark_model(model, X_eval, n_single=BENCHMARK_SINGLE_ROWS, batch_size=BENCHMARK_BATCH_SIZE,
+                    n_batches=BENCHMARK_BATCHES, random_state=42):
+    """
+    Latency (ms), peak memory and size of model.predict_proba on eval texts.
+    Rows are sampled from X_eval; the first call is a warm-up and not timed.
+    """
+    texts = np.asarray(X_eval.tolist() if hasattr(X_eval, 'tolist') else list(X_eval), dtype=object)
+    rng = np.random.default_rng(random_state)
+    model.predict_proba(texts[:1].tolist())
+
+    single_ms = [_timed_ms(model.predict_proba, [text]) for text in rng.choice(texts, size=n_single)]
+    batches = [rng.choice(texts, size=min(batch_size, len(texts)), replace=False).tolist() for _ in range(n_batches)]
+    batch_ms = [_timed_ms(model.predict_proba, batch) for batch in batches]
+
+    # Python and numpy allocations made while scoring one batch
+    tracemalloc.start()
+    try:
+        model.predict_proba(batches[0])
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'single_p50_ms': float(np.percentile(single_ms, 50)),
+        'single_p99_ms': float(np.percentile(single_ms, 99)),
+        'batch_p50_ms': float(np.percentile(batch_ms, 50)),
+        'batch_p99_ms': float(np.percentile(batch_ms, 99)),
+        'batch_rows_per_second': len(batches[0]) * 1000 / float(np.median(batch_ms)),
+        'batch_peak_memory_mb': peak_bytes / 2**20,
+        'model_size_mb': len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 2**20
+    }
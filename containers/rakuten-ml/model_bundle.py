@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Champion bundle format for Rakuten product classification
+Each part (pipeline, label encoder, category mapping) is pickled with protocol 5; numpy
+buffers go out-of-band into a separate raw file, 64-byte aligned, that the loader memory-maps,
+so arrays are neither copied nor deserialized and all API workers share their pages.
+A JSON manifest lists the parts, so a loader only reads what it needs. Part files are
+objects of the models artifact store; buffers can be zstd/lz4 compressed for transport.
+
+Usage: python model_bundle.py  (cold-load benchmark of the champion, pickle vs bundle)
+"""
+import json
+import mmap
+import os
+import pickle
+import subprocess
+import sys
+from datetime import datetime
+
+from artifact_store import ArtifactStore
+
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+# Smaller buffers stay inside the pickle
+BUNDLE_MIN_BUFFER_BYTES = 4096
+BUNDLE_COMPRESSIONS = ('none', 'zstd', 'lz4')
+
+def _aligned(offset):
+    return (offset + BUNDLE_ALIGNMENT - 1) // BUNDLE_ALIGNMENT * BUNDLE_ALIGNMENT
+
+def _pack_part(obj, store, compression):
+    """Pickle obj into the store: (manifest entry of the part, bytes written)"""
+    buffers = []
+    def buffer_callback(buffer):
+        if buffer.raw().nbytes < BUNDLE_MIN_BUFFER_BYTES:
+            return True  # Serialized in-band
+        buffers.append(buffer.raw())
+        return False
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+
+    layout, offset = [], 0
+    for buffer in buffers:
+        offset = _aligned(offset)
+        layout.append([offset, buffer.nbytes])
+        offset += buffer.nbytes
+    raw = bytearray(offset)
+    for (start, nbytes), buffer in zip(layout, buffers):
+        raw[start:start + nbytes] = buffer
+
+    if compression != 'none' and len(raw):
+        import pyarrow as pa  # Only needed for compressed bundles
+        raw = pa.compress(bytes(raw), codec=compression, asbytes=True)
+    entry = {
+        'kind': 'pickle',
+        'pickle': store.put_bytes(data),
+        'buffers': store.put_bytes(raw) if layout else None,
+        'buffer_layout': layout,
+        'buffers_nbytes': offset,
+    }
+    return entry, len(data) + len(raw)
+
+def save_bundle(parts, manifest_path, compression='none'):
+    """
+    Write {name: object} as a bundle: part files into the artifact store of the manifest's
+    directory, then the manifest (atomically). Returns {manifest or object path: sha256}
+    for an artifact store ref.
+    """
+    if compression not in BUNDLE_COMPRESSIONS:
+        raise ValueError(f"Unknown bundle compression '{compression}' (expected one of {BUNDLE_COMPRESSIONS})")
+    store = ArtifactStore(os.path.dirname(manifest_path) or '.')
+    manifest = {'format_version': BUNDLE_FORMAT_VERSION, 'created': datetime.now().isoformat(),
+                'compression': compression, 'parts': {}}
+    total_bytes = 0
+    for name, obj in parts.items():
+        manifest['parts'][name], nbytes = _pack_part(obj, store, compression)
+        total_bytes += nbytes
+
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"Model bundle saved: {manifest_path} ({', '.join(parts)}; {total_bytes / 2**20:.1f} MB, compression {compression})")
+
+    objects = {}
+    for entry in manifest['parts'].values():
+        for sha256 in (entry['pickle'], entry['buffers']):
+            if sha256:
+                objects[store.object_path(sha256)] = sha256
+    return objects
+
+def _map_buffers(path, entry, compression):
+    """Out-of-band buffers of a part: views into a read-only memory map (or decompressed bytes)"""
+    with open(path, 'rb') as f:
+        if compression == 'none':
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            import pyarrow as pa
+            data = pa.decompress(f.read(), decompressed_size=entry['buffers_nbytes'], codec=compression, asbytes=True)
+    view = memoryview(data)
+    return [view[start:start + nbytes] for start, nbytes in entry['buffer_layout']]
+
+def load_bundle(manifest_path, parts=None):
+    """
+    Load the named parts of a bundle (all by default) as {name: object}. Arrays of
+    uncompressed bundles are read-only views of the memory-mapped buffer files.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest['format_version'] != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format: {manifest['format_version']}")
+    store = ArtifactStore(os.path.dirname(manifest_path) or '.')
+
+    loaded = {}
+    for name in parts or manifest['parts']:
+        entry = manifest['parts'][name]
+        buffers = []
+        if entry['buffers']:
+            buffers = _map_buffers(store.object_path(entry['buffers']), entry, manifest['compression'])
+        with open(store.object_path(entry['pickle']), 'rb') as f:
+            loaded[name] = pickle.loads(f.read(), buffers=buffers)
+    return loaded
+
+# Run in a fresh interpreter per measurement, so every load is a cold start
+_COLD_LOAD_SCRIPT = """
+import json, pickle, sys, time
+sys.path.insert(0, {scripts_dir!r})
+import numpy, sklearn  # Interpreter and library start-up is not part of the load
+
+def memory_mb():
+    status = dict(line.split(':', 1) for line in open('/proc/self/status'))
+    return {{key: int(status[key].split()[0]) / 1024 for key in ('RssAnon', 'RssFile')}}
+
+before = memory_mb()
+start = time.perf_counter()
+if {fmt!r} == 'pickle':
+    with open({model_path!r}, 'rb') as f:
+        model = pickle.load(f)
+    with open({encoder_path!r}, 'rb') as f:
+        label_encoder = pickle.load(f)
+else:
+    from model_bundle import load_bundle
+    model = load_bundle({manifest_path!r}, parts=['pipeline', 'label_encoder'])['pipeline']
+load_seconds = time.perf_counter() - start
+loaded = memory_mb()
+model.predict_proba(['chaise de jardin en bois'])
+first_seconds = time.perf_counter() - start
+scored = memory_mb()
+print(json.dumps({{
+    'load_seconds': load_seconds,
+    'first_prediction_seconds': first_seconds,
+    'rss_anon_mb': loaded['RssAnon'] - before['RssAnon'],
+    'rss_file_mb': loaded['RssFile'] - before['RssFile'],
+    'rss_anon_after_predict_mb': scored['RssAnon'] - before['RssAnon']
+}}))
+"""
+
+def benchmark_cold_load(model_path, encoder_path, manifest_path, repeats=3):
+    """
+    Cold-start load time and memory growth (private RssAnon vs shareable, file-backed RssFile)
+    of the pickled champion and of its bundle, each in fresh processes. Returns
+    {'pickle': {...}, 'bundle': {...}} with the median of each measurement.
+    """
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for fmt in ('pickle', 'bundle'):
+        runs = []
+        for _ in range(repeats):
+            script = _COLD_LOAD_SCRIPT.format(scripts_dir=scripts_dir, fmt=fmt, model_path=model_path,
+                                              encoder_path=encoder_path, manifest_path=manifest_path)
+            output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[fmt] = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+    return results
+
+def main():
+    results = benchmark_cold_load('models/the_best_model.pkl', 'models/the_label_encoder.pkl', 'models/the_best_model_bundle.json')
+    print(f"{'':28}{'pickle':>12}{'bundle':>12}")
+    for key in results['pickle']:
+        print(f"{key:28}{results['pickle'][key]:12.3f}{results['bundle'][key]:12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Online training script for Rakuten product classification
+Updates a hashing-features + SGDClassifier model with partial_fit on newly preprocessed rows only,
+between the full GridSearchCV retrains. Also provides the out-of-core training mode of training.py,
+which trains the same model over a stream of mini-batches with a fixed memory budget
+"""
+
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+import mlflow
+import mlflow.sklearn
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder
+
+from processed_text_store import iter_batches
+from training import (
+    MODELS_DIR, PROCESSED_DATA_DIR, TRAINING_COLUMNS,
+    atomic_pickle_dump, load_eval_data, log_benchmark, register_if_best_model
+)
+
+ONLINE_MODEL_PATH = os.path.join(MODELS_DIR, 'online_model.pkl')
+ONLINE_ENCODER_PATH = os.path.join(MODELS_DIR, 'online_label_encoder.pkl')
+ONLINE_STATE_PATH = os.path.join(MODELS_DIR, 'online_state.json')
+
+# Stateless featurizer: nothing to refit when new rows (or new words) arrive
+ONLINE_N_FEATURES = int(os.environ.get('ONLINE_N_FEATURES', str(2 ** 18)))
+ONLINE_ALPHA = float(os.environ.get('ONLINE_ALPHA', '1e-5'))
+ONLINE_BATCH_SIZE = int(os.environ.get('ONLINE_BATCH_SIZE', '5000'))
+
+# Out-of-core training (TRAINING_MODE=out_of_core in training.py)
+OUT_OF_CORE_SOURCE = os.environ.get('OUT_OF_CORE_SOURCE', 'store')  # 'store' (processed Parquet) or 'postgres'
+OUT_OF_CORE_EPOCHS = int(os.environ.get('OUT_OF_CORE_EPOCHS', '3'))
+# Rows whose id is a multiple of HOLDOUT_MODULO form the held-out stream
+HOLDOUT_MODULO = int(os.environ.get('HOLDOUT_MODULO', '10'))
+
+def create_online_model():
+    """Hashing vectorizer + logistic-loss SGD (so the API gets predict_proba)"""
+    return Pipeline([
+        ('vectorizer', HashingVectorizer(
+            n_features=ONLINE_N_FEATURES,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2',
+            lowercase=False,       # Already lowercased in preprocessing
+            strip_accents='unicode'
+        )),
+        ('classifier', SGDClassifier(loss='log_loss', alpha=ONLINE_ALPHA, random_state=42))
+    ])
+
+def load_preprocessing_metadata():
+    """Latest preprocessing metadata (the processed dataset snapshot to train on)"""
+    metadata_path = os.path.join(PROCESSED_DATA_DIR, 'latest_preprocessing.json')
+    if not os.path.exists(metadata_path):
+        raise FileNotFoundError("No preprocessed data found. Please run preprocessing.py first.")
+    with open(metadata_path, 'r') as f:
+        return json.load(f)
+
+def load_online_state(preprocessing_metadata):
+    """
+    Online model, label encoder and state from the previous update, or None when the
+    model has to be trained from scratch (first run, or the dataset was rebuilt)
+    """
+    if not all(os.path.exists(path) for path in (ONLINE_MODEL_PATH, ONLINE_ENCODER_PATH, ONLINE_STATE_PATH)):
+        return None
+    with open(ONLINE_STATE_PATH, 'r') as f:
+        state = json.load(f)
+    if state.get('text_path') != preprocessing_metadata['text_path']:
+        print("Processed dataset was rebuilt since the last online update; starting over")
+        return None
+    with open(ONLINE_MODEL_PATH, 'rb') as f:
+        model = pickle.load(f)
+    with open(ONLINE_ENCODER_PATH, 'rb') as f:
+        label_encoder = pickle.load(f)
+    return model, label_encoder, state
+
+def dataset_categories(preprocessing_metadata, y_eval):
+    """All category codes seen in the processed training data and the eval set"""
+    categories = {int(code) for code in preprocessing_metadata['data_info']['category_distribution']}
+    return np.array(sorted(categories | set(int(code) for code in y_eval)))
+
+def partial_fit_rows(model, label_encoder, parts, after_id):
+    """One partial_fit pass over rows with id > after_id; returns (rows used, highest id)"""
+    vectorizer, classifier = model.named_steps['vectorizer'], model.named_steps['classifier']
+    classes = np.arange(len(label_encoder.classes_))
+    n_rows, max_id = 0, after_id
+    for batch in iter_batches(parts, ['id'] + TRAINING_COLUMNS, batch_size=ONLINE_BATCH_SIZE, min_id=after_id):
+        X_batch = vectorizer.transform(batch['text_classical'].tolist())
+        y_batch = label_encoder.transform(batch['prdtypecode'])
+        classifier.partial_fit(X_batch, y_batch, classes=classes)
+        n_rows += len(batch)
+        max_id = int(batch['id'].max()) if max_id is None else max(max_id, int(batch['id'].max()))
+    return n_rows, max_id
+
+def iter_training_stream(source, preprocessing_metadata, batch_size=ONLINE_BATCH_SIZE):
+    """Mini-batches (id, text_classical, prdtypecode) from the processed store or straight from PostgreSQL"""
+    columns = ['id'] + TRAINING_COLUMNS
+    if source == 'store':
+        yield from iter_batches(preprocessing_metadata['text_parts'], columns, batch_size=batch_size)
+    elif source == 'postgres':
+        # Raw rows through the server-side cursor, normalized batch by batch
+        from preprocessing import PREPROCESSING_WORKERS, iter_raw_data, create_processed_dataframe
+        from text_normalization import normalization_pool
+        with normalization_pool(PREPROCESSING_WORKERS) as executor:
+            for raw_chunk in iter_raw_data(chunk_size=batch_size):
+                df_processed = create_processed_dataframe(raw_chunk, verbose=False, executor=executor)
+                if len(df_processed):
+                    yield df_processed[columns].reset_index(drop=True)
+    else:
+        raise ValueError(f"Unknown OUT_OF_CORE_SOURCE '{source}' (expected 'store' or 'postgres')")
+
+def source_categories(source, preprocessing_metadata):
+    """Category codes present in the training source"""
+    if source == 'postgres':
+        from preprocessing import engine
+        return set(pd.read_sql('SELECT DISTINCT prdtypecode FROM "y_train"', con=engine)['prdtypecode'].astype(int))
+    return {int(code) for code in preprocessing_metadata['data_info']['category_distribution']}
+
+def weighted_f1_from_confusion(confusion):
+    """Weighted F1 (as f1_score(average='weighted')) from an accumulated confusion matrix"""
+    true_positives = np.diag(confusion).astype(np.float64)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+    denominator = precision + recall
+    f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+    return float((f1 * support).sum() / support.sum()) if support.sum() else 0.0
+
+def train_out_of_core():
+    """
+    Train the hashing + SGD model over the whole dataset in mini-batches. Memory is bounded
+    by the batch size and the model, not the number of rows. Every HOLDOUT_MODULO-th id is
+    never trained on; it is scored while streaming and again after the last epoch.
+    """
+    source = OUT_OF_CORE_SOURCE
+    print(f"Starting out-of-core training from '{source}' ({OUT_OF_CORE_EPOCHS} epochs, batches of {ONLINE_BATCH_SIZE})")
+    print("=" * 60)
+    preprocessing_metadata = load_preprocessing_metadata() if source == 'store' else None
+    text_df_eval, _ = load_eval_data()
+    X_eval = text_df_eval['text_classical']
+    y_eval = text_df_eval['prdtypecode']
+
+    categories = np.array(sorted(source_categories(source, preprocessing_metadata) | set(int(code) for code in y_eval)))
+    label_encoder = LabelEncoder().fit(categories)
+    classes = np.arange(len(categories))
+    model = create_online_model()
+    vectorizer, classifier = model.named_steps['vectorizer'], model.named_steps['classifier']
+
+    def holdout_mask(batch):
+        return (batch['id'] % HOLDOUT_MODULO == 0).to_numpy()
+
+    with mlflow.start_run():
+        mlflow.set_tag("training_mode", "out_of_core")
+        start = time.perf_counter()
+        n_train = n_holdout = 0
+        for epoch in range(1, OUT_OF_CORE_EPOCHS + 1):
+            # Progressive validation: held-out rows are scored by the model as it is at that point
+            confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+            n_train = n_holdout = 0
+            for batch in iter_training_stream(source, preprocessing_metadata):
+                holdout = holdout_mask(batch)
+                y_batch = label_encoder.transform(batch['prdtypecode'])
+                X_batch = vectorizer.transform(batch['text_classical'].tolist())
+                if holdout.any() and hasattr(classifier, 'coef_'):
+                    np.add.at(confusion, (y_batch[holdout], classifier.predict(X_batch[holdout])), 1)
+                if (~holdout).any():
+                    classifier.partial_fit(X_batch[~holdout], y_batch[~holdout], classes=classes)
+                n_train += int((~holdout).sum())
+                n_holdout += int(holdout.sum())
+            if epoch > 1:
+                progressive_f1 = weighted_f1_from_confusion(confusion)
+                print(f"Epoch {epoch}: {n_train} training rows, progressive holdout F1 {progressive_f1:.4f}")
+                mlflow.log_metric("holdout_f1_progressive", progressive_f1, step=epoch)
+            else:
+                print(f"Epoch {epoch}: {n_train} training rows, {n_holdout} held out")
+        train_seconds = time.perf_counter() - start
+
+        # Final pass over the held-out stream with the finished model
+        confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+        for batch in iter_training_stream(source, preprocessing_metadata):
+            holdout = holdout_mask(batch)
+            if holdout.any():
+                y_batch = label_encoder.transform(batch['prdtypecode'][holdout])
+                y_pred = model.predict(batch['text_classical'][holdout].tolist())
+                np.add.at(confusion, (y_batch, y_pred), 1)
+        holdout_f1 = weighted_f1_from_confusion(confusion)
+        holdout_accuracy = float(np.trace(confusion) / confusion.sum()) if confusion.sum() else 0.0
+
+        y_eval_pred = label_encoder.inverse_transform(model.predict(X_eval))
+        eval_f1 = f1_score(y_eval, y_eval_pred, average='weighted')
+        eval_accuracy = accuracy_score(y_eval, y_eval_pred)
+        print(f"Holdout Stream Weighted F1 Score: {holdout_f1:.4f}")
+        print(f"Eval Set Weighted F1 Score: {eval_f1:.4f}")
+        print(f"Eval Set Accuracy: {eval_accuracy:.4f}")
+
+        mlflow.log_params({
+            "training_source": source,
+            "epochs": OUT_OF_CORE_EPOCHS,
+            "batch_size": ONLINE_BATCH_SIZE,
+            "n_features": ONLINE_N_FEATURES,
+            "alpha": ONLINE_ALPHA,
+            "text_version": "text_classical"
+        })
+        mlflow.log_metrics({
+            "holdout_f1": holdout_f1,
+            "holdout_accuracy": holdout_accuracy,
+            "eval_f1": float(eval_f1),
+            "eval_accuracy": float(eval_accuracy),
+            "train_seconds": float(train_seconds),
+            # A full retrain: the DAG compares n_samples with x_train
+            "n_samples": int(n_train + n_holdout)
+        })
+        benchmark = log_benchmark(model, X_eval, label_encoder)
+        mlflow.sklearn.log_model(model, "model")
+
+        results = {
+            'eval_f1_score': eval_f1,
+            'eval_accuracy': eval_accuracy,
+            'label_encoder': label_encoder,
+            'best_estimator': model,
+            'benchmark': benchmark,
+            'compiled_model': None
+        }
+        register_if_best_model(results)
+
+    print("=" * 60)
+    print("OUT-OF-CORE TRAINING COMPLETED")
+    return results
+
+def main():
+    """Incremental update of the online model"""
+    print("Starting online training update...")
+    print("=" * 60)
+    preprocessing_metadata = load_preprocessing_metadata()
+    parts = preprocessing_metadata['text_parts']
+    text_df_eval, _ = load_eval_data()
+    X_eval = text_df_eval['text_classical']
+    y_eval = text_df_eval['prdtypecode']
+    categories = dataset_categories(preprocessing_metadata, y_eval)
+
+    previous = load_online_state(preprocessing_metadata)
+    if previous is not None and not set(categories) <= set(previous[1].classes_):
+        # partial_fit cannot add classes to an existing model
+        print("New categories appeared since the last online update; starting over")
+        previous = None
+
+    if previous is None:
+        model = create_online_model()
+        label_encoder = LabelEncoder().fit(categories)
+        state = {'max_trained_id': None, 'n_trained': 0, 'text_path': preprocessing_metadata['text_path']}
+        print(f"Training online model from scratch ({len(categories)} categories)")
+    else:
+        model, label_encoder, state = previous
+        print(f"Updating online model with rows above id {state['max_trained_id']}")
+
+    start = time.perf_counter()
+    n_new, max_id = partial_fit_rows(model, label_encoder, parts, state['max_trained_id'])
+    update_seconds = time.perf_counter() - start
+
+    if n_new == 0:
+        print("No new rows since the last online update")
+        return None
+    state.update({'max_trained_id': max_id, 'n_trained': state['n_trained'] + n_new})
+    print(f"partial_fit on {n_new} new rows in {update_seconds:.1f}s ({state['n_trained']} rows in total)")
+
+    with mlflow.start_run():
+        mlflow.set_tag("training_mode", "online")
+        y_eval_pred = label_encoder.inverse_transform(model.predict(X_eval))
+        eval_f1 = f1_score(y_eval, y_eval_pred, average='weighted')
+        eval_accuracy = accuracy_score(y_eval, y_eval_pred)
+        print(f"Eval Set Weighted F1 Score: {eval_f1:.4f}")
+        print(f"Eval Set Accuracy: {eval_accuracy:.4f}")
+
+        # Not logged as n_samples: the DAG compares that metric with x_train to schedule full retrains
+        mlflow.log_params({
+            "n_features": ONLINE_N_FEATURES,
+            "alpha": ONLINE_ALPHA,
+            "text_version": "text_classical"
+        })
+        mlflow.log_metrics({
+            "eval_f1": float(eval_f1),
+            "eval_accuracy": float(eval_accuracy),
+            "online_new_rows": int(n_new),
+            "online_n_trained": int(state['n_trained']),
+            "online_update_seconds": float(update_seconds)
+        })
+        benchmark = log_benchmark(model, X_eval, label_encoder)
+        mlflow.sklearn.log_model(model, "model")
+
+        # Model and encoder before the state: a crash in between only repeats rows
+        atomic_pickle_dump(model, ONLINE_MODEL_PATH)
+        atomic_pickle_dump(label_encoder, ONLINE_ENCODER_PATH)
+        with open(f"{ONLINE_STATE_PATH}.tmp", 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{ONLINE_STATE_PATH}.tmp", ONLINE_STATE_PATH)
+
+        # Served only if it beats the production model, like a full retrain
+        results = {
+            'eval_f1_score': eval_f1,
+            'eval_accuracy': eval_accuracy,
+            'label_encoder': label_encoder,
+            'best_estimator': model,
+            'benchmark': benchmark,
+            'compiled_model': None
+        }
+        register_if_best_model(results)
+
+    print("=" * 60)
+    print("ONLINE UPDATE COMPLETED")
+    return state
+
+if __name__ == "__main__":
+    main()
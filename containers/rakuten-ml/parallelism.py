@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+CPU planning for Rakuten model training
+Splits the CPUs available to the container between outer (candidates x folds) and
+inner (estimator threads, BLAS/OpenMP) parallelism, and measures achieved CPU utilization
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from joblib import parallel_config
+from threadpoolctl import threadpool_limits
+
+# Set to override the detected CPU count
+TRAINING_CPUS = int(os.environ.get('TRAINING_CPUS', '0'))
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_CPU_STAT = '/sys/fs/cgroup/cpu.stat'
+
+def available_cpus():
+    """CPUs this process may use: affinity mask, capped by the cgroup (docker --cpus) quota"""
+    if TRAINING_CPUS > 0:
+        return TRAINING_CPUS
+    try:
+        n_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n_cpus = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            n_cpus = min(n_cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return n_cpus
+
+def plan_parallelism(n_tasks, n_cpus=None):
+    """
+    Outer worker processes and threads per worker for n_tasks independent fits.
+    Every CPU gets work and outer x inner never exceeds the CPU count.
+    """
+    n_cpus = n_cpus or available_cpus()
+    outer_jobs = max(1, min(n_cpus, n_tasks))
+    inner_threads = max(1, n_cpus // outer_jobs)
+    return {'n_cpus': n_cpus, 'n_tasks': n_tasks, 'outer_jobs': outer_jobs, 'inner_threads': inner_threads}
+
+@contextmanager
+def limit_inner_threads(inner_threads):
+    """Pin BLAS/OpenMP thread pools, in this process and in joblib's loky workers"""
+    with parallel_config(backend='loky', inner_max_num_threads=inner_threads), threadpool_limits(limits=inner_threads):
+        yield
+
+def _cpu_seconds():
+    """CPU time used so far by the container (cgroup), or by the whole machine"""
+    try:
+        with open(CGROUP_CPU_STAT) as f:
+            for line in f:
+                key, value = line.split()
+                if key == 'usage_usec':
+                    return int(value) / 1e6
+    except (OSError, ValueError):
+        pass
+    # /proc/stat: jiffies per CPU state on the first line; everything but idle and iowait is busy
+    with open('/proc/stat') as f:
+        fields = [int(value) for value in f.readline().split()[1:]]
+    busy = sum(fields) - fields[3] - fields[4]
+    return busy / os.sysconf('SC_CLK_TCK')
+
+class CpuUtilization:
+    """Achieved utilization of n_cpus between start() and stop(): CPU seconds / (wall seconds x n_cpus)"""
+
+    def __init__(self, n_cpus):
+        self.n_cpus = n_cpus
+        self.utilization = None
+        self.wall_seconds = None
+
+    def start(self):
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_seconds()
+        return self
+
+    def stop(self):
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        cpu_seconds = _cpu_seconds() - self._start_cpu
+        self.utilization = cpu_seconds / (self.wall_seconds * self.n_cpus) if self.wall_seconds > 0 else 0.0
+        return self.utilization
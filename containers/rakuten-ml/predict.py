@@ -8,20 +8,53 @@ import json
 import pickle
 import pandas as pd
 import numpy as np
-from preprocessing import preprocess_text
+from text_normalization import french_normalizer
+from linear_scorer import LinearScorer
+from model_bundle import load_bundle
 import os
 import glob
+import hashlib
+import shutil
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future
+
+MODEL_PATH = 'models/the_best_model.pkl'
+ENCODER_PATH = 'models/the_label_encoder.pkl'
+CATEGORY_MAPPING_PATH = 'containers/rakuten-ml/category_mapping.json'
+
+# Numpy-only compiled version of a linear champion (written by training.py); preferred when present
+COMPILED_MODEL_PATH = 'models/the_best_model_linear.npz'
+USE_COMPILED_MODEL = os.environ.get('USE_COMPILED_MODEL', '1') == '1'
+
+# Champion bundle (written by training.py): arrays are memory-mapped instead of unpickled
+MODEL_BUNDLE_PATH = 'models/the_best_model_bundle.json'
+USE_MODEL_BUNDLE = os.environ.get('USE_MODEL_BUNDLE', '1') == '1'
+
+# How often (seconds) the holder stats the model files to detect a new champion
+MODEL_RELOAD_CHECK_SECONDS = float(os.environ.get('MODEL_RELOAD_CHECK_SECONDS', '1.0'))
+
+# Large model arrays are moved to memory-mapped .npy files so all API workers share one copy
+# (for champions without a bundle; bundle arrays are shared already)
+SHARE_MODEL_ARRAYS = os.environ.get('SHARE_MODEL_ARRAYS', '1') == '1'
+SHARED_ARRAYS_DIR = os.environ.get('SHARED_ARRAYS_DIR', 'models/shared_arrays')
+SHARED_ARRAY_MIN_BYTES = 16 * 1024
+
+# Cache of prediction results keyed on preprocessed text + model version
+PREDICTION_CACHE_MAX_MB = float(os.environ.get('PREDICTION_CACHE_MAX_MB', '64'))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', '3600'))
 
 def load_category_mapping():
     """Load category number to name mapping"""
     try:
-        with open('containers/rakuten-ml/category_mapping.json', 'r') as f:
+        with open(CATEGORY_MAPPING_PATH, 'r') as f:
             return json.load(f)
     except FileNotFoundError:
         print("Warning: category_mapping.json not found, using numeric categories")
         return {}
 
-def load_latest_model_and_encoder():
+def load_latest_model_and_encoder(model_path=MODEL_PATH, encoder_path=ENCODER_PATH):
     # """Load the most recent trained model and label encoder"""
     
     # # Find latest model files by timestamp
@@ -35,8 +68,8 @@ def load_latest_model_and_encoder():
     # latest_model = sorted(model_files)[-1]
     # latest_encoder = sorted(encoder_files)[-1]
     
-    latest_model = 'models/the_best_model.pkl'
-    latest_encoder = 'models/the_label_encoder.pkl'
+    latest_model = model_path
+    latest_encoder = encoder_path
     
     print(f"Loading model: {latest_model}")
     print(f"Loading encoder: {latest_encoder}")
@@ -51,74 +84,378 @@ def load_latest_model_and_encoder():
     
     return model, label_encoder
 
+def _iter_estimators(obj, name='model', depth=0):
+    """Yield (name, estimator) for the model and every fitted estimator nested inside it"""
+    if depth > 4 or isinstance(obj, type) or not hasattr(obj, 'get_params'):
+        return
+    yield name, obj
+    for attr, value in vars(obj).items():
+        if hasattr(value, 'get_params'):
+            yield from _iter_estimators(value, f"{name}.{attr}", depth + 1)
+        elif isinstance(value, (list, tuple)):
+            for i, item in enumerate(value):
+                # Pipeline steps are (name, estimator) tuples
+                if isinstance(item, tuple) and len(item) == 2:
+                    item = item[1]
+                yield from _iter_estimators(item, f"{name}.{attr}[{i}]", depth + 1)
+
+def share_model_arrays(model, shared_dir):
+    """
+    Replace large numpy arrays in a fitted model (coef_, idf_, ...) by read-only
+    memory maps of .npy files in shared_dir. Every process that maps the same files
+    shares the pages through the OS page cache instead of holding a private copy.
+    """
+    os.makedirs(shared_dir, exist_ok=True)
+    shared_bytes = 0
+    for name, estimator in _iter_estimators(model):
+        for attr, value in list(vars(estimator).items()):
+            if not isinstance(value, np.ndarray) or value.dtype == object or value.nbytes < SHARED_ARRAY_MIN_BYTES:
+                continue
+            path = os.path.join(shared_dir, f"{name}.{attr}.npy")
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, value)
+                try:
+                    # link() publishes the complete file and fails if another worker got there first
+                    os.link(tmp_path, path)
+                except FileExistsError:
+                    pass  # Map the winner's file, so every worker shares the same pages
+                finally:
+                    os.remove(tmp_path)
+            setattr(estimator, attr, np.load(path, mmap_mode='r'))
+            shared_bytes += value.nbytes
+    
+    # Keep this version and the previous one (workers that have not reloaded yet may still be
+    # sharing it); older versions are no longer needed (open maps stay valid after unlink)
+    parent_dir = os.path.dirname(shared_dir)
+    current_mtime = os.stat(shared_dir).st_mtime_ns
+    others = sorted(
+        (entry.stat().st_mtime_ns, entry.path) for entry in os.scandir(parent_dir)
+        if entry.is_dir() and entry.path != shared_dir
+    )
+    for mtime, entry_path in others[:-1]:
+        if mtime <= current_mtime:
+            shutil.rmtree(entry_path, ignore_errors=True)
+    
+    print(f"Shared {shared_bytes / 1e6:.1f} MB of model arrays via {shared_dir}")
+    return model
+
+# Everything a prediction needs, swapped as one immutable unit
+ModelSnapshot = namedtuple('ModelSnapshot', ['model', 'label_encoder', 'category_mapping', 'class_names', 'version'])
+
+class ModelHolder:
+    """
+    Process-wide cache for the serving model, label encoder and category mapping.
+    Loads them once and swaps in a new snapshot when training replaces the model files.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, encoder_path=ENCODER_PATH, compiled_path=COMPILED_MODEL_PATH,
+                 bundle_path=MODEL_BUNDLE_PATH, check_interval=MODEL_RELOAD_CHECK_SECONDS):
+        self.model_path = model_path
+        self.encoder_path = encoder_path
+        self.compiled_path = compiled_path if USE_COMPILED_MODEL else None
+        self.bundle_path = bundle_path if USE_MODEL_BUNDLE else None
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._snapshot_stamp = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        """Identify the files on disk; inode changes when training does an atomic replace"""
+        stats = [os.stat(path) for path in (self.model_path, self.encoder_path)]
+        stamp = tuple((st.st_ino, st.st_mtime_ns, st.st_size) for st in stats)
+        for path in (self.compiled_path, self.bundle_path):
+            if path and os.path.exists(path):
+                st = os.stat(path)
+                stamp += ((st.st_ino, st.st_mtime_ns, st.st_size),)
+        return stamp
+
+    def _load(self, stamp):
+        category_mapping = load_category_mapping()
+        from_bundle = False
+        
+        if self.compiled_path and os.path.exists(self.compiled_path):
+            # Linear champion: no unpickling and no sklearn, labels are stored in the artifact
+            print(f"Loading compiled model: {self.compiled_path}")
+            model, label_encoder = LinearScorer.load(self.compiled_path), None
+            classes_numeric = model.class_labels
+        elif self.bundle_path and os.path.exists(self.bundle_path):
+            # Only the small pickles are deserialized; arrays are mapped from the page cache, shared by all workers
+            print(f"Loading model bundle: {self.bundle_path}")
+            parts, from_bundle = load_bundle(self.bundle_path), True
+            model, label_encoder = parts['pipeline'], parts['label_encoder']
+            category_mapping = parts.get('category_mapping') or category_mapping
+            classes_numeric = label_encoder.inverse_transform(model.classes_) if hasattr(model, 'classes_') else []
+        else:
+            model, label_encoder = load_latest_model_and_encoder(self.model_path, self.encoder_path)
+            classes_numeric = label_encoder.inverse_transform(model.classes_) if hasattr(model, 'classes_') else []
+        
+        # Category names aligned with the model's probability columns
+        class_names = [category_mapping.get(str(c), f"Unknown Category {c}") for c in classes_numeric]
+        
+        # Every served file counts: training replaces the compiled scorer and bundle before the pickle,
+        # and a reload in between serves a new model that must not share the old cache entries
+        version = f"{stamp[0][1]}-{hashlib.sha256(repr(stamp).encode()).hexdigest()[:12]}"
+        if SHARE_MODEL_ARRAYS and not isinstance(model, LinearScorer) and not from_bundle:
+            try:
+                share_model_arrays(model, os.path.join(SHARED_ARRAYS_DIR, version))
+            except OSError as e:
+                print(f"Warning: could not share model arrays, keeping private copies: {e}")
+        print(f"Model snapshot loaded (version {version})")
+        return ModelSnapshot(model, label_encoder, category_mapping, class_names, version)
+
+    @property
+    def version(self):
+        """Version of the snapshot currently in memory, without triggering a load"""
+        return self._snapshot.version if self._snapshot is not None else None
+
+    def get(self):
+        """Return the current snapshot, reloading first if the model files changed"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._snapshot is not None and time.monotonic() - self._last_check < self.check_interval:
+                return self._snapshot
+            try:
+                stamp = self._file_stamp()
+                if self._snapshot is None or self._snapshot_stamp != stamp:
+                    new_snapshot = self._load(stamp)
+                    self._snapshot_stamp = stamp
+                    self._snapshot = new_snapshot
+            except Exception as e:
+                # Keep serving the previous model if the new one cannot be loaded
+                if self._snapshot is None:
+                    raise
+                print(f"Warning: model reload failed, keeping version {self._snapshot.version}: {e}")
+            self._last_check = time.monotonic()
+            return self._snapshot
+
+model_holder = ModelHolder()
+
+class PredictionCache:
+    """
+    Thread-safe LRU + TTL cache of prediction results.
+    Keys combine the model version, top_k and a hash of the preprocessed text, and the
+    whole cache is dropped as soon as a different model version is seen.
+    Cached result dicts are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_mb=PREDICTION_CACHE_MAX_MB, ttl_seconds=PREDICTION_CACHE_TTL_SECONDS):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(text_classical, top_k):
+        return (top_k, hashlib.blake2b(text_classical.encode('utf-8'), digest_size=16).digest())
+
+    @staticmethod
+    def _estimate_size(result):
+        """Rough in-memory size of a result dict (bytes)"""
+        return 400 + sum(200 + len(entry["category"]) for entry in result["top_3"])
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get_many(self, keys, version):
+        """Return cached results (None for misses), in the order of keys"""
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            self._check_version(version)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] < now:
+                    # Expired entries count as misses and are dropped right away
+                    self._bytes -= entry[1]
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    results.append(entry[2])
+        return results
+
+    def put_many(self, keys, results, version):
+        if self.max_bytes <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            # The model may have been swapped while these results were computed
+            if version != self._version:
+                return
+            for key, result in zip(keys, results):
+                size = self._estimate_size(result)
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[1]
+                self._entries[key] = (expires_at, size, result)
+                self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": self._bytes / (1024 * 1024),
+                "max_mb": self.max_bytes / (1024 * 1024),
+                "ttl_seconds": self.ttl_seconds,
+                "model_version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+prediction_cache = PredictionCache()
+
+class SingleFlight:
+    """
+    Collapse concurrent computations of the same key into one.
+    The first caller to claim a key computes it; callers claiming the same key
+    while it is in flight wait for that result instead of computing it again.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def claim(self, keys):
+        """
+        Split unique keys into (owned, waiting). The caller must compute every owned key
+        and then call resolve() or fail(); waiting maps keys to Futures of other callers.
+        """
+        owned, waiting = [], {}
+        with self._lock:
+            for key in keys:
+                future = self._calls.get(key)
+                if future is None:
+                    self._calls[key] = Future()
+                    owned.append(key)
+                else:
+                    waiting[key] = future
+            self.coalesced += len(waiting)
+        return owned, waiting
+
+    def resolve(self, keys, results):
+        with self._lock:
+            futures = [self._calls.pop(key) for key in keys]
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def fail(self, keys, error):
+        with self._lock:
+            futures = [self._calls.pop(key) for key in keys]
+        for future in futures:
+            future.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "coalesced": self.coalesced}
+
+in_flight_predictions = SingleFlight()
+
+def empty_text_result():
+    """Result returned for items whose text is empty after preprocessing"""
+    return {
+        "error": "Text became empty after preprocessing",
+        "category": None,
+        "confidence": 0.0,
+        "top_3": []
+    }
+
+def score_texts(texts_classical, snapshot, top_k=3):
+    """
+    Score already preprocessed texts with one vectorizer transform and one classifier call.
+    Returns one result dict per text, in input order.
+    """
+    model = snapshot.model
+    class_names = snapshot.class_names
+
+    if hasattr(model, 'predict_proba'):
+        probabilities = model.predict_proba(texts_classical)
+        k = min(top_k, probabilities.shape[1])
+
+        # Top-k per row without sorting every class: partition, then sort only the k winners
+        top_indices = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+        top_probabilities = np.take_along_axis(probabilities, top_indices, axis=1)
+        order = np.argsort(-top_probabilities, axis=1)
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_probabilities = np.take_along_axis(top_probabilities, order, axis=1)
+
+        return [
+            {
+                "category": class_names[row_indices[0]],
+                "confidence": float(row_probabilities[0]),
+                "top_3": [
+                    {"category": class_names[i], "confidence": float(p)}
+                    for i, p in zip(row_indices, row_probabilities)
+                ]
+            }
+            for row_indices, row_probabilities in zip(top_indices.tolist(), top_probabilities.tolist())
+        ]
+
+    # For models without predict_proba (like SVM without probability=True)
+    predictions_numeric = snapshot.label_encoder.inverse_transform(model.predict(texts_classical))
+    results = []
+    for prediction_numeric in predictions_numeric:
+        prediction_category = snapshot.category_mapping.get(str(prediction_numeric), f"Unknown Category {prediction_numeric}")
+        results.append({
+            "category": prediction_category,
+            "confidence": 1.0,
+            "top_3": [{"category": prediction_category, "confidence": 1.0}]
+        })
+    return results
+
 def predict_single(title, description):
     """
     Make prediction for a single product using existing preprocessing pipeline
     """
     try:
-        # Step 1: Load category mapping
-        category_mapping = load_category_mapping()
-        
-        # Step 2: Combine title and description (same as preprocessing.py)
+        # Step 1: Combine title and description (same as preprocessing.py)
         combined_text = f"{title} {description}".strip()
         
-        # Step 3: Apply same preprocessing as training
-        text_classical = preprocess_text(combined_text)
+        # Step 2: Apply same preprocessing as training
+        text_classical = french_normalizer.normalize(combined_text)
         
         if not text_classical:
-            return {
-                "error": "Text became empty after preprocessing",
-                "category": None,
-                "confidence": 0.0,
-                "top_3": []
-            }
+            return empty_text_result()
         
         print(f"Original text: {combined_text[:100]}...")
         print(f"Preprocessed text: {text_classical[:100]}...")
         
-        # Step 4: Load model and encoder
-        model, label_encoder = load_latest_model_and_encoder()
+        # Step 3: Score through the prediction cache and single-flight, like the batch paths
+        result = score_preprocessed([text_classical])[0]
         
-        # Step 5: The model is a pipeline that expects raw text (it handles vectorization internally)
-        prediction_encoded = model.predict([text_classical])[0]
-        prediction_numeric = label_encoder.inverse_transform([prediction_encoded])[0]
+        print(f"Category name: {result['category']}")
         
-        # Convert numeric category to name
-        prediction_category = category_mapping.get(str(prediction_numeric), f"Unknown Category {prediction_numeric}")
-        
-        print(f"Encoded prediction: {prediction_encoded}")
-        print(f"Numeric prediction: {prediction_numeric}")
-        print(f"Category name: {prediction_category}")
-        
-        # Step 6: Get prediction probabilities
-        if hasattr(model, 'predict_proba'):
-            probabilities = model.predict_proba([text_classical])[0]
-            classes_encoded = model.classes_
-            classes_numeric = label_encoder.inverse_transform(classes_encoded)
-            
-            # Get top 3 predictions
-            top_3_indices = np.argsort(probabilities)[-3:][::-1]
-            top_3 = [
-                {
-                    "category": category_mapping.get(str(classes_numeric[i]), f"Unknown Category {classes_numeric[i]}"),
-                    "confidence": float(probabilities[i])
-                }
-                for i in top_3_indices
-            ]
-            
-            # Find confidence for the top prediction
-            confidence = float(probabilities[classes_encoded == prediction_encoded][0])
-            
-        else:
-            # For models without predict_proba (like SVM without probability=True)
-            confidence = 1.0
-            top_3 = [{"category": prediction_category, "confidence": 1.0}]
-        
-        return {
-            "category": prediction_category,
-            "confidence": confidence,
-            "top_3": top_3
-        }
+        return result
         
     except Exception as e:
         print(f"Error in prediction: {str(e)}")
@@ -129,6 +466,65 @@ def predict_single(title, description):
             "top_3": []
         }
 
+def preprocess_items(items):
+    """Combine and preprocess (title, description) pairs exactly like preprocessing.py"""
+    return french_normalizer.normalize_many([f"{title} {description}".strip() for title, description in items])
+
+def score_preprocessed(texts_classical, top_k=3):
+    """
+    Score preprocessed texts in one vectorized pass
+    Texts that are empty after preprocessing get an error entry instead of a prediction
+    """
+    snapshot = model_holder.get()
+    
+    text_positions = [i for i, text in enumerate(texts_classical) if text]
+    keys = [prediction_cache.make_key(texts_classical[i], top_k) for i in text_positions]
+    cached = prediction_cache.get_many(keys, snapshot.version)
+    
+    results = [empty_text_result() for _ in texts_classical]
+    missed = {}  # key -> positions, so duplicate texts are scored once
+    for position, key, result in zip(text_positions, keys, cached):
+        if result is None:
+            missed.setdefault(key, []).append(position)
+        else:
+            results[position] = result
+    
+    # Keys already being scored by a concurrent call are awaited instead of recomputed
+    flight_keys = {(snapshot.version, key): key for key in missed}
+    owned, waiting = in_flight_predictions.claim(list(flight_keys))
+    
+    # Only keys this call owns go through the model, still in a single call
+    if owned:
+        owned_keys = [flight_keys[flight_key] for flight_key in owned]
+        try:
+            scored = score_texts([texts_classical[missed[key][0]] for key in owned_keys], snapshot, top_k=top_k)
+        except Exception as e:
+            in_flight_predictions.fail(owned, e)
+            raise
+        # Cache before releasing the in-flight keys, so later callers always find the result
+        prediction_cache.put_many(owned_keys, scored, snapshot.version)
+        in_flight_predictions.resolve(owned, scored)
+        for key, result in zip(owned_keys, scored):
+            for position in missed[key]:
+                results[position] = result
+    
+    for flight_key, future in waiting.items():
+        result = future.result()
+        for position in missed[flight_keys[flight_key]]:
+            results[position] = result
+    
+    print(f"Batch prediction: {len(owned)} scored, {len(waiting)} shared with concurrent calls, "
+          f"{len(text_positions) - sum(len(p) for p in missed.values())} from cache, "
+          f"{len(texts_classical) - len(text_positions)} empty (model version {snapshot.version})")
+    return results
+
+def predict_batch(items, top_k=3):
+    """
+    Make predictions for many (title, description) pairs in one vectorized pass
+    Items whose text is empty after preprocessing get an error entry instead of a prediction
+    """
+    return score_preprocessed(preprocess_items(items), top_k=top_k)
+
 if __name__ == "__main__":
     # Accept input from command line as JSON
     if len(sys.argv) != 2:
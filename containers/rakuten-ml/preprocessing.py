@@ -7,15 +7,16 @@ Based on proven approach from previous project
 
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sklearn.feature_extraction.text import TfidfVectorizer
 import pickle
 import os
 from datetime import datetime
 import json
-import string
 import nltk
-from nltk.corpus import stopwords
+from text_normalization import french_normalizer, normalize_parallel, normalization_pool
+from processed_text_store import TEXT_FORMAT, write_parquet_part, iter_column
+from artifact_store import ArtifactStore
 
 # Download required NLTK data
 nltk.download('stopwords', quiet=True)
@@ -28,54 +29,90 @@ engine = create_engine(DATABASE_URL)
 PROCESSED_DATA_DIR = 'processed_data'
 MODELS_DIR = 'models'
 
+# Per-run outputs are hard links into a content-addressed store on each volume
+data_store = ArtifactStore(PROCESSED_DATA_DIR)
+model_store = ArtifactStore(MODELS_DIR)
+
+# Parallel text normalization (0 = one process per core, 1 = single process)
+PREPROCESSING_WORKERS = int(os.environ.get('PREPROCESSING_WORKERS', '0'))
+PREPROCESSING_CHUNK_SIZE = int(os.environ.get('PREPROCESSING_CHUNK_SIZE', '5000'))
+
+# Rows fetched per round trip from the server-side cursor (bounds loader memory)
+LOAD_CHUNK_SIZE = int(os.environ.get('LOAD_CHUNK_SIZE', '20000'))
+
+LATEST_METADATA_PATH = os.path.join(PROCESSED_DATA_DIR, 'latest_preprocessing.json')
+
+# Set to 1 to reprocess every row instead of only rows above the id watermark
+PREPROCESSING_FULL_REBUILD = os.environ.get('PREPROCESSING_FULL_REBUILD', '0') == '1'
+
 def create_output_dirs():
     """Create necessary output directories"""
     os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
     os.makedirs(MODELS_DIR, exist_ok=True)
 
-def load_raw_data():
-    """Load raw data from PostgreSQL database"""
-    print("Loading raw data from PostgreSQL...")
-    
-    # Load features (text data)
-    features_query = 'SELECT id, designation, description FROM "x_train"'
-    X_data = pd.read_sql(features_query, con=engine)
-    
-    # Load targets
-    targets_query = 'SELECT id, prdtypecode FROM "y_train"'
-    y_data = pd.read_sql(targets_query, con=engine)
-    
-    # Merge on id
-    data = pd.merge(X_data, y_data, on='id')
-    
-    print(f"Loaded {len(data)} samples with {data['prdtypecode'].nunique()} unique categories")
-    return data
+def get_source_snapshot(max_id=None):
+    """Number of joined x_train/y_train rows and their highest id (only ids <= max_id if given)"""
+    query = '''
+        SELECT COUNT(*), MAX(x.id)
+        FROM "x_train" x
+        JOIN "y_train" y ON x.id = y.id
+    '''
+    params = {}
+    if max_id is not None:
+        query += ' WHERE x.id <= :max_id'
+        params['max_id'] = max_id
+    with engine.connect() as conn:
+        n_rows, last_id = conn.execute(text(query), params).fetchone()
+    return int(n_rows), (int(last_id) if last_id is not None else None)
+
+def iter_raw_data(chunk_size=LOAD_CHUNK_SIZE, after_id=None, up_to_id=None):
+    """
+    Stream raw data from PostgreSQL in chunks of chunk_size rows, optionally only
+    ids in (after_id, up_to_id].
+    x_train and y_train are joined in SQL and read through a server-side (named)
+    cursor, so only one chunk is held in memory at a time.
+    """
+    print(f"Streaming raw data from PostgreSQL in chunks of {chunk_size} rows...")
+    conditions, params = [], {}
+    if after_id is not None:
+        conditions.append('x.id > :after_id')
+        params['after_id'] = after_id
+    if up_to_id is not None:
+        conditions.append('x.id <= :up_to_id')
+        params['up_to_id'] = up_to_id
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    query = text(f'''
+        SELECT x.id, x.designation, x.description, y.prdtypecode
+        FROM "x_train" x
+        JOIN "y_train" y ON x.id = y.id
+        {where}
+        ORDER BY x.id
+    ''')
+
+    n_rows = 0
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+        for chunk in pd.read_sql(query, con=conn, params=params, chunksize=chunk_size):
+            n_rows += len(chunk)
+            yield chunk
+    print(f"Loaded {n_rows} samples")
 
 def preprocess_text(text):
     """
     Preprocess text: lowercase, remove punctuation, and remove stop words
     Based on the proven approach from previous project
     """
-    if pd.isna(text):  # Handle NaN values
-        return ""
-    
-    text = text.lower()  # Convert to lowercase, because stopwords are case-sensitive
-    text = text.translate(str.maketrans('', '', string.punctuation))  # Remove punctuation
-    
-    # Get French stop words (matching original approach)
-    french_stop_words = set(stopwords.words('french'))
-    text = ' '.join([word for word in text.split() if word not in french_stop_words])  # Remove stop words
-    
-    return text
+    return french_normalizer.normalize(text)
 
-def create_processed_dataframe(data):
+def create_processed_dataframe(data, verbose=True, executor=None):
     """
     Create processed DataFrame with multiple text versions:
     - text_raw: Combined but minimal cleaning
     - text_classical: Heavy preprocessing for classical ML (current approach)
     - text_bert: Placeholder for future BERT preprocessing
+    executor is the run's normalization pool (see text_normalization.normalization_pool)
     """
-    print("Creating processed DataFrame with multiple text versions...")
+    log = print if verbose else (lambda *args: None)
+    log("Creating processed DataFrame with multiple text versions...")
     
     # Fill NaN values with empty string
     data['designation'] = data['designation'].fillna('')
@@ -85,15 +122,20 @@ def create_processed_dataframe(data):
     df_processed = data[['id', 'designation', 'description', 'prdtypecode']].copy()
     
     # 1. Create raw combined text (minimal cleaning)
-    print("Creating text_raw (minimal cleaning)...")
+    log("Creating text_raw (minimal cleaning)...")
     df_processed['text_raw'] = (df_processed['designation'] + ' ' + df_processed['description']).str.strip()
     
     # 2. Create classical ML text (heavy preprocessing)
-    print("Creating text_classical (French stopwords, punctuation removal)...")
-    df_processed['text_classical'] = df_processed['text_raw'].apply(preprocess_text)
+    log("Creating text_classical (French stopwords, punctuation removal)...")
+    df_processed['text_classical'] = normalize_parallel(
+        df_processed['text_raw'],
+        n_workers=PREPROCESSING_WORKERS,
+        chunk_size=PREPROCESSING_CHUNK_SIZE,
+        executor=executor
+    )
     
     # 3. Placeholder for future BERT text (minimal preprocessing)
-    print("Creating text_bert placeholder (basic cleaning only)...")
+    log("Creating text_bert placeholder (basic cleaning only)...")
     df_processed['text_bert'] = df_processed['text_raw'].str.lower().str.strip()
     
     # Keep all text versions and target
@@ -102,13 +144,38 @@ def create_processed_dataframe(data):
     # Remove rows with empty classical text (since that's what we're using now)
     df_processed = df_processed[df_processed['text_classical'].str.len() > 0]
     
-    print(f"After preprocessing: {len(df_processed)} samples remain")
-    print(f"Sample text_raw: {df_processed['text_raw'].iloc[0][:100]}...")
-    print(f"Sample text_classical: {df_processed['text_classical'].iloc[0][:100]}...")
+    log(f"After preprocessing: {len(df_processed)} samples remain")
+    if len(df_processed):
+        log(f"Sample text_raw: {df_processed['text_raw'].iloc[0][:100]}...")
+        log(f"Sample text_classical: {df_processed['text_classical'].iloc[0][:100]}...")
     
     return df_processed
 
-def extract_text_features(df_processed, max_features=1000):
+def iter_processed_chunks(raw_chunks, executor=None):
+    """Generator stage: normalize each raw chunk as it arrives from the loader, on one shared pool"""
+    for chunk_number, raw_chunk in enumerate(raw_chunks, start=1):
+        df_processed = create_processed_dataframe(raw_chunk, verbose=False, executor=executor)
+        print(f"Chunk {chunk_number}: {len(raw_chunk)} rows loaded, {len(df_processed)} kept")
+        yield df_processed
+
+def write_processed_text(processed_chunks, part_path):
+    """
+    Write processed chunks to a Parquet part file as they are produced (one row group each).
+    Returns the statistics of the written rows, merged from per-chunk statistics.
+    """
+    print(f"Writing processed text to {part_path}...")
+    chunk_stats = []
+
+    def collect_statistics(chunks):
+        for df_processed in chunks:
+            if len(df_processed):
+                chunk_stats.append(get_data_statistics(df_processed))
+            yield df_processed
+
+    write_parquet_part(collect_statistics(processed_chunks), part_path)
+    return merge_data_statistics(chunk_stats)
+
+def extract_text_features(texts, max_features=1000):
     """Extract TF-IDF features from classical ML preprocessed text"""
     print("Extracting TF-IDF features from text_classical...")
     
@@ -122,15 +189,15 @@ def extract_text_features(df_processed, max_features=1000):
         strip_accents='unicode'
     )
     
-    # Fit and transform the classical ML text data
-    X_features = vectorizer.fit_transform(df_processed['text_classical'])
+    # Fit and transform the classical ML text data (a single pass, so texts may be a generator)
+    X_features = vectorizer.fit_transform(texts)
     
     print(f"Created {X_features.shape[1]} TF-IDF features")
     
     return X_features, vectorizer
 
-def save_processed_data(X_features, y_target, vectorizer, df_processed, data_info):
-    """Save processed features, text versions, and vectorizer"""
+def save_processed_data(X_features, y_target, vectorizer, text_path, text_parts, data_info, timestamp, source_state):
+    """Save processed features, targets, and vectorizer (text versions are already written to text_parts)"""
     print("Saving processed data...")
     
     def convert_numpy_types(obj):
@@ -147,9 +214,6 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
             return [convert_numpy_types(item) for item in obj]
         return obj
 
-    # Create timestamp for versioning
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
     # Save features (sparse matrix)
     features_path = os.path.join(PROCESSED_DATA_DIR, f'X_features_{timestamp}.npz')
     from scipy.sparse import save_npz
@@ -157,16 +221,12 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
     
     # Save targets
     targets_path = os.path.join(PROCESSED_DATA_DIR, f'y_target_{timestamp}.npy')
-    np.save(targets_path, y_target.values)
-    
-    # Save processed text DataFrame (with all text versions)
-    text_path = os.path.join(PROCESSED_DATA_DIR, f'processed_text_{timestamp}.csv')
-    df_processed.to_csv(text_path, index=False)
+    np.save(targets_path, y_target)
     
     # Save vectorizer
+    # Incremental runs keep the vectorizer: the new name links to the object already stored
     vectorizer_path = os.path.join(MODELS_DIR, f'vectorizer_{timestamp}.pkl')
-    with open(vectorizer_path, 'wb') as f:
-        pickle.dump(vectorizer, f)
+    vectorizer_sha = model_store.save_pickle(vectorizer, vectorizer_path)
     
     # Save preprocessing metadata
     metadata = {
@@ -174,6 +234,8 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
         'features_path': features_path,
         'targets_path': targets_path,
         'text_path': text_path,
+        'text_format': TEXT_FORMAT,
+        'text_parts': text_parts,
         'vectorizer_path': vectorizer_path,
         'n_samples': X_features.shape[0],
         'n_features': X_features.shape[1],
@@ -191,16 +253,27 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
             'max_df': vectorizer.max_df,
             'source_text': 'text_classical'
         },
-        'data_info': data_info
+        'data_info': data_info,
+        # Watermark for incremental runs: rows with id <= max_processed_id are in text_parts
+        'max_processed_id': source_state['max_processed_id'],
+        'n_source_rows': source_state['n_source_rows']
     }
     
     metadata_path = os.path.join(PROCESSED_DATA_DIR, f'preprocessing_metadata_{timestamp}.json')
     with open(metadata_path, 'w') as f:
         json.dump(convert_numpy_types(metadata), f, indent=2)
     
+    # Only new part files are hashed; parts kept from the previous snapshot are already stored
+    previous_ref = data_store.get_ref('latest')
+    stored = previous_ref['artifacts'] if previous_ref else {}
+    snapshot = {part: stored.get(part) or data_store.adopt(part) for part in text_parts}
+    for path in (features_path, targets_path, metadata_path):
+        snapshot[path] = data_store.adopt(path)
+    data_store.set_ref('latest', snapshot)
+    model_store.set_ref('vectorizer', {vectorizer_path: vectorizer_sha})
+    
     # Save "latest" symlinks for easy access
-    latest_metadata_path = os.path.join(PROCESSED_DATA_DIR, 'latest_preprocessing.json')
-    with open(latest_metadata_path, 'w') as f:
+    with open(LATEST_METADATA_PATH, 'w') as f:
         json.dump(convert_numpy_types(metadata), f, indent=2)
 
     print(f"Features saved: {features_path}")
@@ -226,6 +299,62 @@ def get_data_statistics(df_processed):
     }
     return stats
 
+def merge_data_statistics(chunk_stats):
+    """Combine get_data_statistics results of several chunks into dataset-wide statistics"""
+    total_samples = sum(stats['total_samples'] for stats in chunk_stats)
+    category_distribution = {}
+    for stats in chunk_stats:
+        for category, count in stats['category_distribution'].items():
+            category_distribution[category] = category_distribution.get(category, 0) + count
+
+    def weighted_mean(key):
+        if not total_samples:
+            return float('nan')
+        return sum(stats['text_stats'][key] * stats['total_samples'] for stats in chunk_stats if stats['total_samples']) / total_samples
+
+    return {
+        'total_samples': total_samples,
+        'unique_categories': len(category_distribution),
+        'category_distribution': dict(sorted(category_distribution.items(), key=lambda item: item[1], reverse=True)),
+        'text_stats': {
+            'avg_raw_length': weighted_mean('avg_raw_length'),
+            'avg_classical_length': weighted_mean('avg_classical_length'),
+            'avg_bert_length': weighted_mean('avg_bert_length'),
+            'empty_classical_count': sum(stats['text_stats']['empty_classical_count'] for stats in chunk_stats)
+        }
+    }
+
+def load_latest_metadata():
+    """Metadata of the previous preprocessing run, or None"""
+    if not os.path.exists(LATEST_METADATA_PATH):
+        return None
+    with open(LATEST_METADATA_PATH, 'r') as f:
+        return json.load(f)
+
+def full_rebuild_reason(previous):
+    """Why the previous run's output cannot be extended incrementally (None if it can)"""
+    if PREPROCESSING_FULL_REBUILD:
+        return "PREPROCESSING_FULL_REBUILD=1"
+    if previous is None:
+        return "no previous preprocessing run"
+    if previous.get('max_processed_id') is None or previous.get('text_format') != TEXT_FORMAT:
+        return f"previous run has no id watermark or no {TEXT_FORMAT} dataset"
+    for path in [previous['features_path'], previous['targets_path'], previous['vectorizer_path']] + previous['text_parts']:
+        if not os.path.exists(path):
+            return f"{path} is missing"
+    # Rows at or below the watermark must be exactly the ones processed before;
+    # anything else means the tables were reset or rewritten
+    n_rows, _ = get_source_snapshot(max_id=previous['max_processed_id'])
+    if n_rows != previous['n_source_rows']:
+        return f"source tables changed below the watermark ({previous['n_source_rows']} rows processed, {n_rows} found)"
+    return None
+
+def restore_data_statistics(data_info):
+    """Statistics loaded back from JSON (category codes become ints again)"""
+    data_info = dict(data_info)
+    data_info['category_distribution'] = {int(category): count for category, count in data_info['category_distribution'].items()}
+    return data_info
+
 def main():
     """Main preprocessing pipeline"""
     print("Starting data preprocessing pipeline...")
@@ -236,22 +365,64 @@ def main():
         # Step 1: Create output directories
         create_output_dirs()
         
-        # Step 2: Load raw data
-        data = load_raw_data()
+        # Create timestamp for versioning
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        # Step 3: Create processed DataFrame (matching original approach)
-        df_processed = create_processed_dataframe(data)
+        # Step 2: Decide between an incremental run and a full rebuild
+        previous = load_latest_metadata()
+        rebuild_reason = full_rebuild_reason(previous)
+        n_source_rows, max_id = get_source_snapshot()
         
-        # Step 4: Get data statistics
-        data_stats = get_data_statistics(df_processed)
-        print(f"Dataset statistics: {data_stats}")
+        if rebuild_reason is None:
+            after_id = previous['max_processed_id']
+            if max_id is None or max_id <= after_id:
+                print(f"No new rows above id {after_id}, processed data is up to date")
+                return previous
+            print(f"Incremental run: processing rows with {after_id} < id <= {max_id}")
+            # New rows go into another part file of the existing dataset directory
+            text_path = previous['text_path']
+            text_parts = list(previous['text_parts'])
+        else:
+            after_id = None
+            print(f"Full rebuild: {rebuild_reason}")
+            text_path = os.path.join(PROCESSED_DATA_DIR, f'processed_text_{timestamp}')
+            text_parts = []
+            os.makedirs(text_path, exist_ok=True)
+        
+        # Steps 3-4: Stream raw data, create processed text (matching original approach)
+        # chunk by chunk, write it out and collect statistics along the way
+        part_path = os.path.join(text_path, f'part-{timestamp}.parquet')
+        # One worker pool for the whole stream: started once, every chunk split across all workers
+        with normalization_pool(PREPROCESSING_WORKERS) as executor:
+            processed_chunks = iter_processed_chunks(iter_raw_data(after_id=after_id, up_to_id=max_id), executor)
+            data_stats = write_processed_text(processed_chunks, part_path)
+        new_parts = [part_path] if os.path.exists(part_path) else []
+        text_parts += new_parts
         
-        # Step 5: Extract features
-        X_features, vectorizer = extract_text_features(df_processed)
-        y_target = df_processed['prdtypecode']
+        # Step 5: Extract features, reading the processed text back in batches
+        if after_id is None:
+            X_features, vectorizer = extract_text_features(iter_column(text_parts, 'text_classical'))
+            y_target = np.fromiter(iter_column(text_parts, 'prdtypecode'), dtype=np.int64)
+        else:
+            # Only the new rows are transformed, with the vectorizer fitted at the last full rebuild
+            from scipy.sparse import load_npz, vstack
+            with open(previous['vectorizer_path'], 'rb') as f:
+                vectorizer = pickle.load(f)
+            X_new = vectorizer.transform(iter_column(new_parts, 'text_classical'))
+            y_new = np.fromiter(iter_column(new_parts, 'prdtypecode'), dtype=np.int64)
+            print(f"Transformed {X_new.shape[0]} new rows with the existing vectorizer")
+            X_features = vstack([load_npz(previous['features_path']), X_new], format='csr')
+            y_target = np.concatenate([np.load(previous['targets_path']), y_new])
+            data_stats = merge_data_statistics([restore_data_statistics(previous['data_info']), data_stats])
+        print(f"Dataset statistics: {data_stats}")
         
         # Step 6: Save processed data
-        metadata = save_processed_data(X_features, y_target, vectorizer, df_processed, data_stats)
+        source_state = {'max_processed_id': max_id, 'n_source_rows': n_source_rows}
+        metadata = save_processed_data(X_features, y_target, vectorizer, text_path, text_parts, data_stats, timestamp, source_state)
+        
+        # Step 7: Drop old per-run snapshots (both volumes) that nothing points to anymore
+        data_store.collect_garbage()
+        model_store.collect_garbage()
         
         print("=" * 60)
         print("Preprocessing completed successfully!")
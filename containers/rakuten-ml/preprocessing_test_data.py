@@ -13,9 +13,9 @@ import pickle
 import os
 from datetime import datetime
 import json
-import string
 import nltk
-from nltk.corpus import stopwords
+from text_normalization import french_normalizer, normalize_parallel
+from processed_text_store import TEXT_FORMAT, write_parquet_part
 
 # Download required NLTK data
 nltk.download('stopwords', quiet=True)
@@ -28,6 +28,10 @@ engine = create_engine(DATABASE_URL)
 PROCESSED_DATA_DIR = 'processed_data'
 MODELS_DIR = 'models'
 
+# Parallel text normalization (0 = one process per core, 1 = single process)
+PREPROCESSING_WORKERS = int(os.environ.get('PREPROCESSING_WORKERS', '0'))
+PREPROCESSING_CHUNK_SIZE = int(os.environ.get('PREPROCESSING_CHUNK_SIZE', '5000'))
+
 def create_output_dirs():
     """Create necessary output directories"""
     os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
@@ -56,17 +60,7 @@ def preprocess_text(text):
     Preprocess text: lowercase, remove punctuation, and remove stop words
     Based on the proven approach from previous project
     """
-    if pd.isna(text):  # Handle NaN values
-        return ""
-    
-    text = text.lower()  # Convert to lowercase, because stopwords are case-sensitive
-    text = text.translate(str.maketrans('', '', string.punctuation))  # Remove punctuation
-    
-    # Get French stop words (matching original approach)
-    french_stop_words = set(stopwords.words('french'))
-    text = ' '.join([word for word in text.split() if word not in french_stop_words])  # Remove stop words
-    
-    return text
+    return french_normalizer.normalize(text)
 
 def create_processed_dataframe(data):
     """
@@ -90,7 +84,11 @@ def create_processed_dataframe(data):
     
     # 2. Create classical ML text (heavy preprocessing)
     print("Creating text_classical (French stopwords, punctuation removal)...")
-    df_processed['text_classical'] = df_processed['text_raw'].apply(preprocess_text)
+    df_processed['text_classical'] = normalize_parallel(
+        df_processed['text_raw'],
+        n_workers=PREPROCESSING_WORKERS,
+        chunk_size=PREPROCESSING_CHUNK_SIZE
+    )
     
     # 3. Placeholder for future BERT text (minimal preprocessing)
     print("Creating text_bert placeholder (basic cleaning only)...")
@@ -160,8 +158,8 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
     np.save(targets_path, y_target.values)
     
     # Save processed text DataFrame (with all text versions)
-    text_path = os.path.join(PROCESSED_DATA_DIR, f'processed_text_test.csv')
-    df_processed.to_csv(text_path, index=False)
+    text_path = os.path.join(PROCESSED_DATA_DIR, f'processed_text_test.parquet')
+    write_parquet_part([df_processed], text_path)
     
     # Save vectorizer
     vectorizer_path = os.path.join(MODELS_DIR, f'vectorizer_test.pkl')
@@ -174,6 +172,8 @@ def save_processed_data(X_features, y_target, vectorizer, df_processed, data_inf
         'features_path': features_path,
         'targets_path': targets_path,
         'text_path': text_path,
+        'text_format': TEXT_FORMAT,
+        'text_parts': [text_path],
         'vectorizer_path': vectorizer_path,
         'n_samples': X_features.shape[0],
         'n_features': X_features.shape[1],
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Columnar storage for processed text in Rakuten product classification
+The processed dataset is a directory of zstd-compressed Parquet part files;
+readers load only the columns they need, memory-mapped
+"""
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+TEXT_FORMAT = 'parquet'
+PARQUET_COMPRESSION = 'zstd'
+
+PROCESSED_TEXT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('text_raw', pa.string()),
+    ('text_classical', pa.string()),
+    ('text_bert', pa.string()),
+    ('prdtypecode', pa.int64()),
+])
+
+def write_parquet_part(frames, part_path):
+    """
+    Write processed DataFrames (any iterable, consumed lazily) as the row groups of
+    one Parquet file. The file only appears under part_path once it is complete.
+    Returns the number of rows written; nothing is written if there are none.
+    """
+    tmp_path = f"{part_path}.tmp"
+    writer = None
+    n_rows = 0
+    try:
+        for df in frames:
+            if not len(df):
+                continue
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, PROCESSED_TEXT_SCHEMA, compression=PARQUET_COMPRESSION)
+            writer.write_table(pa.Table.from_pandas(df[PROCESSED_TEXT_SCHEMA.names], schema=PROCESSED_TEXT_SCHEMA, preserve_index=False))
+            n_rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(tmp_path, part_path)
+    return n_rows
+
+def list_parts(text_path):
+    """Parquet part files of a dataset directory in write order (or the file itself)"""
+    if os.path.isdir(text_path):
+        return sorted(glob.glob(os.path.join(text_path, '*.parquet')))
+    return [text_path]
+
+def is_parquet(text_path):
+    return os.path.isdir(text_path) or text_path.endswith('.parquet')
+
+def read_processed_text(text_path, columns=None, parts=None, memory_map=True):
+    """
+    Load processed text as a DataFrame, reading only the given columns.
+    parts restricts a Parquet dataset to those files (the snapshot listed in the
+    preprocessing metadata); CSV files from older runs are still supported.
+    """
+    if not is_parquet(text_path):
+        return pd.read_csv(text_path, usecols=columns)
+
+    schema = PROCESSED_TEXT_SCHEMA if columns is None else pa.schema([PROCESSED_TEXT_SCHEMA.field(c) for c in columns])
+    tables = [pq.read_table(path, columns=columns, memory_map=memory_map) for path in (parts or list_parts(text_path))]
+    table = pa.concat_tables(tables) if tables else schema.empty_table()
+    return table.to_pandas()
+
+def iter_column(parts, column, batch_size=20000):
+    """Yield the values of one column across part files, one record batch at a time"""
+    for path in parts:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[column]):
+            yield from batch.column(0).to_pylist()
+
+def iter_batches(parts, columns, batch_size=20000, min_id=None):
+    """
+    Yield DataFrames of at most batch_size rows with the given columns, in write order.
+    With min_id only rows with a larger id are returned; row groups whose id statistics
+    show nothing above min_id are not read at all.
+    """
+    read_columns = columns if min_id is None or 'id' in columns else ['id'] + list(columns)
+    for path in parts:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        row_groups = list(range(parquet_file.num_row_groups))
+        if min_id is not None:
+            id_index = parquet_file.schema_arrow.get_field_index('id')
+            row_groups = [
+                i for i in row_groups
+                if (stats := parquet_file.metadata.row_group(i).column(id_index).statistics) is None
+                or not stats.has_min_max or stats.max > min_id
+            ]
+        if not row_groups:
+            continue
+        for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=read_columns):
+            df = batch.to_pandas()
+            if min_id is not None:
+                df = df[df['id'] > min_id]
+            if len(df):
+                yield df[list(columns)].reset_index(drop=True)
+
+def load_processed_text(metadata, columns=None):
+    """Processed text described by a preprocessing metadata dict"""
+    return read_processed_text(metadata['text_path'], columns=columns, parts=metadata.get('text_parts'))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Successive halving with stratified resource subsets for Rakuten model training
+HalvingGridSearchCV draws each round's sample budget from the CV folds with a plain random
+draw, so rare categories can vanish from the small early rounds; here the draw keeps the
+category proportions of every fold
+"""
+from inspect import signature
+
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingGridSearchCV)
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.utils import resample
+
+class StratifiedSubsampleSplitter:
+    """Splits of base_cv, each train and test side cut down to fraction of its rows stratified on y"""
+
+    def __init__(self, base_cv, fraction, subsample_test=True, random_state=None):
+        self.base_cv = base_cv
+        self.fraction = fraction
+        self.subsample_test = subsample_test
+        self.random_state = random_state
+
+    def _subsample(self, indices, y):
+        return resample(indices, replace=False, stratify=y[indices], random_state=self.random_state,
+                        n_samples=int(self.fraction * len(indices)))
+
+    def split(self, X, y, groups=None, **kwargs):
+        for train, test in self.base_cv.split(X, y, groups, **kwargs):
+            yield self._subsample(train, y), self._subsample(test, y) if self.subsample_test else test
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return self.base_cv.get_n_splits(X, y, groups)
+
+class StratifiedHalvingGridSearchCV(HalvingGridSearchCV):
+    """HalvingGridSearchCV (resource='n_samples') whose per-round subsets are stratified on the labels"""
+
+    def _run_search(self, evaluate_candidates, *args, **kwargs):
+        def evaluate_stratified(candidate_params, cv, *eval_args, **eval_kwargs):
+            # The rounds below the full training set get sklearn's random subsampling splitter
+            if hasattr(cv, 'fraction') and hasattr(cv, 'base_cv'):
+                cv = StratifiedSubsampleSplitter(cv.base_cv, cv.fraction, cv.subsample_test, cv.random_state)
+            return evaluate_candidates(candidate_params, cv, *eval_args, **eval_kwargs)
+        return super()._run_search(evaluate_stratified, *args, **kwargs)
+
+    # fit() passes extra keywords (e.g. callback_ctx) only to a _run_search that declares them
+    _run_search.__signature__ = signature(HalvingGridSearchCV._run_search)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Text normalization for Rakuten product classification
+Lowercase, remove punctuation and French stop words - shared by preprocessing and prediction
+"""
+import os
+import string
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import nltk
+import pandas as pd
+from nltk.corpus import stopwords
+
+def load_french_stopwords():
+    """French stop words from NLTK, downloading the corpus on first use"""
+    try:
+        return stopwords.words('french')
+    except LookupError:
+        nltk.download('stopwords', quiet=True)
+        return stopwords.words('french')
+
+class TextNormalizer:
+    """
+    Reusable normalizer with the stop word set and punctuation table built once.
+    Output is identical to the original preprocess_text: lowercase, strip
+    string.punctuation, drop French stop words, join with single spaces.
+    """
+
+    def __init__(self, stop_words=None):
+        self.stop_words = frozenset(load_french_stopwords() if stop_words is None else stop_words)
+        self.punctuation_table = str.maketrans('', '', string.punctuation)
+
+    def normalize(self, text):
+        """Normalize a single text (NaN/None become an empty string)"""
+        if not isinstance(text, str) and pd.isna(text):
+            return ""
+        stop_words = self.stop_words
+        return ' '.join([word for word in text.lower().translate(self.punctuation_table).split() if word not in stop_words])
+
+    def normalize_many(self, texts):
+        """
+        Normalize a pandas Series (returns a Series with the same index) or any
+        iterable of texts (returns a list)
+        """
+        stop_words = self.stop_words
+        table = self.punctuation_table
+        values = texts.tolist() if isinstance(texts, pd.Series) else texts
+
+        normalized = []
+        append = normalized.append
+        for text in values:
+            if not isinstance(text, str) and pd.isna(text):
+                append("")
+                continue
+            append(' '.join([word for word in text.lower().translate(table).split() if word not in stop_words]))
+
+        if isinstance(texts, pd.Series):
+            return pd.Series(normalized, index=texts.index, name=texts.name)
+        return normalized
+
+# Shared instance for the French stop word setup used across the project
+french_normalizer = TextNormalizer()
+
+def _normalize_chunk(texts):
+    return french_normalizer.normalize_many(texts)
+
+def resolve_workers(n_workers=0):
+    """Worker processes for n_workers (0 = one per core)"""
+    return n_workers or os.cpu_count() or 1
+
+@contextmanager
+def normalization_pool(n_workers=0):
+    """
+    Process pool reused by every normalize_parallel call of a run (streamed chunks included),
+    so workers start once; yields None when a single worker is configured.
+    """
+    n_workers = resolve_workers(n_workers)
+    if n_workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        yield executor
+
+def normalize_parallel(texts, n_workers=0, chunk_size=5000, executor=None):
+    """
+    Normalize a pandas Series across a process pool, chunk by chunk.
+    Chunks are reassembled in their original order, so the result (same index as
+    texts) is identical to french_normalizer.normalize_many(texts).
+    n_workers=0 uses all cores; chunks are at most chunk_size texts but small enough
+    to give every worker one. executor reuses a pool from normalization_pool (with the
+    same n_workers) instead of starting one; with one worker or a single chunk it runs in-process.
+    """
+    n_workers = resolve_workers(n_workers)
+    chunk_size = max(1, min(chunk_size, -(-len(texts) // n_workers)))
+    n_chunks = -(-len(texts) // chunk_size)
+    if n_workers <= 1 or n_chunks <= 1:
+        return french_normalizer.normalize_many(texts)
+
+    values = texts.tolist()
+    chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+
+    def run(pool):
+        normalized = []
+        # map() yields results in submission order, whatever order the chunks finish in
+        for chunk_result in pool.map(_normalize_chunk, chunks):
+            normalized.extend(chunk_result)
+        return pd.Series(normalized, index=texts.index, name=texts.name)
+
+    if executor is not None:
+        return run(executor)
+    print(f"Normalizing {len(values)} texts in {len(chunks)} chunks with {min(n_workers, n_chunks)} processes...")
+    with ProcessPoolExecutor(max_workers=min(n_workers, n_chunks)) as pool:
+        return run(pool)
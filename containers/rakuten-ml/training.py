@@ -8,28 +8,97 @@ Based on proven approach from previous project
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, StratifiedShuffleSplit, GridSearchCV
+from sklearn.model_selection import ParameterGrid
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
+from sklearn.svm import LinearSVC
+from sklearn.calibration import CalibratedClassifierCV
 from xgboost import XGBClassifier
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
+from sklearn.base import clone
 from sklearn.metrics import accuracy_score, classification_report, f1_score
 import pickle
 import json
 import os
+import shutil
+import tempfile
+from joblib import Memory
 from datetime import datetime
 from scipy.sparse import load_npz
 from collections import Counter
 import mlflow
 import mlflow.sklearn
 from mlflow.exceptions import RestException
+from processed_text_store import load_processed_text
+from parallelism import plan_parallelism, limit_inner_threads, CpuUtilization
+from checkpointed_search import CheckpointedGridSearch
+from stratified_halving import StratifiedHalvingGridSearchCV
+from model_benchmark import benchmark_model
+from vocabulary_pruning import prune_vocabulary
+from artifact_store import ArtifactStore
+from model_bundle import save_bundle, benchmark_cold_load
+from linear_scorer import compile_linear_pipeline, quantize_compiled, save_linear_artifact, LinearScorer
 
 # Directories
 PROCESSED_DATA_DIR = 'processed_data'
 MODELS_DIR = 'models'
 
+# Model files are hard links into the content-addressed store of the models volume
+model_store = ArtifactStore(MODELS_DIR)
+
+# Base directory for the per-run cache of fitted vectorizers (system temp dir if unset)
+TRAINING_CACHE_DIR = os.environ.get('TRAINING_CACHE_DIR') or None
+
+# Hyperparameter search: 'grid' fits every candidate on all data, 'halving' runs
+# successive halving (all candidates on small stratified subsets, the best third
+# survives each round while the sample budget triples)
+SEARCH_STRATEGY = os.environ.get('SEARCH_STRATEGY', 'grid')
+CV_FOLDS = 3
+
+# Completed (candidate, fold) scores of the grid search are kept here so a retried run
+# resumes instead of starting over (set to an empty string to disable)
+SEARCH_CHECKPOINT_DIR = os.environ.get('SEARCH_CHECKPOINT_DIR', os.path.join(MODELS_DIR, 'search_checkpoints'))
+HALVING_FACTOR = int(os.environ.get('HALVING_FACTOR', '3'))
+
+# 'gridsearch' loads the dataset and runs the hyperparameter search; 'out_of_core' trains
+# hashing features + SGD over streamed mini-batches (online_training.train_out_of_core)
+TRAINING_MODE = os.environ.get('TRAINING_MODE', 'gridsearch')
+
+# Champion selection among the finalists (best candidate per classifier family) and promotion:
+# 'f1' keeps the search's best model and promotes on eval_f1 alone, 'latency_budget' takes the
+# best eval_f1 whose single-row p99 latency is within LATENCY_BUDGET_MS, 'f1_per_ms' maximizes
+# eval_f1 - F1_PER_MS * p99 latency (the F1 one millisecond of p99 is worth)
+CHAMPION_POLICY = os.environ.get('CHAMPION_POLICY', 'f1')
+LATENCY_BUDGET_MS = float(os.environ.get('LATENCY_BUDGET_MS', '50'))
+F1_PER_MS = float(os.environ.get('F1_PER_MS', '0.001'))
+
+# Chi-square vocabulary pruning of the champion: the smallest of these fractions of its
+# vocabulary whose held-out F1 is within PRUNING_F1_TOLERANCE of the full vocabulary
+VOCABULARY_PRUNING = os.environ.get('VOCABULARY_PRUNING', '1') == '1'
+PRUNING_FRACTIONS = [float(f) for f in os.environ.get('PRUNING_FRACTIONS', '0.1,0.2,0.3,0.5,0.75').split(',')]
+PRUNING_F1_TOLERANCE = float(os.environ.get('PRUNING_F1_TOLERANCE', '0.005'))
+
+# Columns read from the processed text dataset (the other text versions are skipped)
+TRAINING_COLUMNS = ['text_classical', 'prdtypecode']
+
+# Numpy-only serving artifact written next to the_best_model.pkl for linear champions
+COMPILED_MODEL_FILENAME = 'the_best_model_linear.npz'
+COMPILED_MAX_PROBA_DIFF = 1e-4
+# Coefficient storage of the compiled artifact: 'float32', 'float16' or 'int8' (per-class scale).
+# A quantized artifact is only exported if its eval F1 is within QUANTIZED_MAX_F1_DROP of the pipeline's
+COMPILED_QUANTIZATION = os.environ.get('COMPILED_QUANTIZATION', 'float32')
+QUANTIZED_MAX_F1_DROP = float(os.environ.get('QUANTIZED_MAX_F1_DROP', '0.002'))
+
+# Memory-mappable champion bundle (pipeline + label encoder + category mapping) for the API;
+# buffers uncompressed for mmap, or 'zstd'/'lz4' when the bundle is shipped elsewhere
+MODEL_BUNDLE_FILENAME = 'the_best_model_bundle.json'
+MODEL_BUNDLE_COMPRESSION = os.environ.get('MODEL_BUNDLE_COMPRESSION', 'none')
+CATEGORY_MAPPING_PATH = 'containers/rakuten-ml/category_mapping.json'
+# Compare cold-start load time and memory of the pickled champion and its bundle after promotion
+BENCHMARK_COLD_LOAD = os.environ.get('BENCHMARK_COLD_LOAD', '1') == '1'
+
 try:
     from statsd import StatsClient
     statsd = StatsClient(host="statsd-exporter", port=8125, prefix="mlflow")
@@ -53,20 +122,20 @@ def load_latest_processed_data():
     with open(metadata_path, 'r') as f:
         metadata = json.load(f)
     
-    # Load the processed text DataFrame (contains all text versions)
-    text_df = pd.read_csv(metadata['text_path'])
+    # Load only the columns training uses from the processed text dataset
+    text_df = load_processed_text(metadata, columns=TRAINING_COLUMNS)
     
     print(f"Loaded {len(text_df)} samples")
-    print(f"Available text versions: {list(text_df.columns)}")
+    print(f"Loaded columns: {list(text_df.columns)}")
     
     return text_df, metadata
 
 def load_eval_data():
     with open(os.path.join(PROCESSED_DATA_DIR, 'preprocessing_metadata_test.json'), 'r') as f:
         metadata = json.load(f)
-    text_df = pd.read_csv(metadata['text_path'])
+    text_df = load_processed_text(metadata, columns=TRAINING_COLUMNS)
     print(f"Loaded {len(text_df)} samples")
-    print(f"Available text versions: {list(text_df.columns)}")
+    print(f"Loaded columns: {list(text_df.columns)}")
     return text_df, metadata
 
 def print_class_distribution(y, dataset_name):
@@ -133,14 +202,14 @@ def create_pipeline_and_param_grid():
             'classifier__C': [0.1, 1, 10],
             'classifier__penalty': ['l2'],
         },
-        # SVM parameters
+        # SVM parameters: liblinear LinearSVC (linear in the number of rows) with
+        # Platt scaling on held-out folds, so SVM winners have predict_proba
         {
             'vectorizer': [CountVectorizer(), TfidfVectorizer()],
             'vectorizer__max_features': [5000],
             'vectorizer__ngram_range': [(1, 1)],
-            'classifier': [SVC(random_state=42)],
-            'classifier__C': [0.1, 1, 10],
-            'classifier__kernel': ['linear'],  # Only linear kernel for speed
+            'classifier': [CalibratedClassifierCV(LinearSVC(random_state=42), method='sigmoid', cv=3)],
+            'classifier__estimator__C': [0.1, 1, 10],
         },
         # XGBoost parameters
         {
@@ -156,6 +225,194 @@ def create_pipeline_and_param_grid():
     
     return pipeline, param_grid
 
+def check_quantized_model(compiled, best_estimator, label_encoder, X_eval, y_eval):
+    """
+    Quantize the compiled model to COMPILED_QUANTIZATION and compare it with the float64
+    sklearn pipeline on the eval set. Returns the quantized model, or None if it loses
+    more than QUANTIZED_MAX_F1_DROP weighted F1.
+    """
+    quantized = quantize_compiled(compiled, COMPILED_QUANTIZATION)
+    scorer = LinearScorer(quantized)
+    texts = X_eval.tolist()
+    reference_proba = best_estimator.predict_proba(texts)
+    quantized_proba = scorer.predict_proba(texts)
+    
+    reference_f1 = f1_score(y_eval, label_encoder.inverse_transform(reference_proba.argmax(axis=1)), average='weighted')
+    quantized_f1 = f1_score(y_eval, scorer.class_labels[quantized_proba.argmax(axis=1)], average='weighted')
+    f1_drop = float(reference_f1 - quantized_f1)
+    agreement = float((reference_proba.argmax(axis=1) == quantized_proba.argmax(axis=1)).mean())
+    max_diff = float(np.abs(quantized_proba - reference_proba).max())
+    coef_mb = (quantized['coef'].nbytes + quantized['idf'].nbytes) / 2**20
+    print(f"{COMPILED_QUANTIZATION} compiled scorer: eval F1 {quantized_f1:.4f} (float64 {reference_f1:.4f}), "
+          f"{agreement:.2%} same predictions, max predict_proba difference {max_diff:.2e}, {coef_mb:.2f} MB of coefficients")
+    mlflow.log_param("compiled_quantization", COMPILED_QUANTIZATION)
+    mlflow.log_metrics({
+        "quantized_f1_drop": f1_drop,
+        "quantized_agreement": agreement,
+        "quantized_max_proba_diff": max_diff,
+        "quantized_coef_mb": coef_mb
+    })
+    
+    if f1_drop > QUANTIZED_MAX_F1_DROP:
+        print(f"{COMPILED_QUANTIZATION} scorer loses more than {QUANTIZED_MAX_F1_DROP} F1; exporting float32 instead")
+        return None
+    return quantized
+
+def compile_serving_model(best_estimator, label_encoder, X_eval, y_eval):
+    """
+    Compile a linear champion into the numpy-only serving artifact and verify that it
+    reproduces predict_proba of the sklearn pipeline on the eval set (and, if quantized,
+    that it keeps its eval F1)
+    """
+    class_labels = label_encoder.inverse_transform(best_estimator.classes_)
+    compiled = compile_linear_pipeline(best_estimator, class_labels)
+    if compiled is None:
+        print("Best model is not a vectorizer + linear classifier pipeline; serving will use the pickled pipeline")
+        return None
+    
+    sample = X_eval.iloc[:2000].tolist()
+    max_diff = float(np.abs(LinearScorer(compiled).predict_proba(sample) - best_estimator.predict_proba(sample)).max())
+    print(f"Compiled linear scorer: max predict_proba difference {max_diff:.2e} on {len(sample)} eval samples")
+    mlflow.log_metric("compiled_max_proba_diff", max_diff)
+    
+    if max_diff > COMPILED_MAX_PROBA_DIFF:
+        print(f"Compiled scorer differs by more than {COMPILED_MAX_PROBA_DIFF}; not exporting it")
+        return None
+    if COMPILED_QUANTIZATION != 'float32':
+        return check_quantized_model(compiled, best_estimator, label_encoder, X_eval, y_eval) or compiled
+    return compiled
+
+# Classifiers whose n_jobs actually parallelizes a fit (LogisticRegression's only applies to one-vs-rest)
+INNER_THREADED_CLASSIFIERS = (RandomForestClassifier, XGBClassifier, CalibratedClassifierCV)
+
+def set_inner_threads(param_grid, inner_threads):
+    """Threads for estimators that parallelize internally (RandomForest, XGBoost, calibration folds)"""
+    for grid in param_grid:
+        for classifier in grid.get('classifier', []):
+            if isinstance(classifier, INNER_THREADED_CLASSIFIERS):
+                classifier.set_params(n_jobs=inner_threads)
+
+def classifier_family(classifier):
+    """Model family of a grid classifier, e.g. 'LinearSVC' for the calibrated SVM"""
+    if isinstance(classifier, CalibratedClassifierCV):
+        classifier = classifier.estimator
+    return type(classifier).__name__
+
+def select_finalists(search):
+    """Index of the best candidate of every classifier family (last round only for halving)"""
+    cv_results = search.cv_results_
+    candidates = range(len(cv_results['params']))
+    if 'iter' in cv_results:
+        last_round = max(cv_results['iter'])
+        candidates = [i for i in candidates if cv_results['iter'][i] == last_round]
+    finalists = {}
+    for i in sorted(candidates, key=lambda i: cv_results['rank_test_score'][i]):
+        finalists.setdefault(classifier_family(cv_results['params'][i]['classifier']), i)
+    return finalists
+
+def champion_score(eval_f1, single_p99_ms, policy=CHAMPION_POLICY):
+    """Score of a model under CHAMPION_POLICY (higher is better), None if the policy rules it out"""
+    if policy == 'f1':
+        return eval_f1
+    if policy == 'latency_budget':
+        return eval_f1 if single_p99_ms <= LATENCY_BUDGET_MS else None
+    if policy == 'f1_per_ms':
+        return eval_f1 - F1_PER_MS * single_p99_ms
+    raise ValueError(f"Unknown CHAMPION_POLICY '{policy}' (expected 'f1', 'latency_budget' or 'f1_per_ms')")
+
+def serving_form(estimator, label_encoder):
+    """
+    What the API serves for a fitted pipeline: (model, path), where linear pipelines are compiled
+    to the numpy-only LinearScorer at COMPILED_QUANTIZATION and everything else stays sklearn
+    """
+    compiled = compile_linear_pipeline(estimator, label_encoder.inverse_transform(estimator.classes_))
+    if compiled is None:
+        return estimator, 'sklearn_pipeline'
+    return LinearScorer(quantize_compiled(compiled, COMPILED_QUANTIZATION)), f'compiled_linear_{COMPILED_QUANTIZATION}'
+
+def log_benchmark(model, X_eval, label_encoder, prefix=''):
+    """Benchmark inference of a fitted pipeline as it would be served and log it (and the path measured) to MLflow"""
+    serving_model, serving_path = serving_form(model, label_encoder)
+    benchmark = benchmark_model(serving_model, X_eval)
+    mlflow.log_param(f"{prefix}serving_path", serving_path)
+    mlflow.log_metrics({f"{prefix}{key}": value for key, value in benchmark.items()})
+    return benchmark
+
+def select_champion(search, pipeline, X_train, y_train_encoded, X_eval, y_eval, label_encoder):
+    """
+    Refit the best candidate of every classifier family, benchmark them all on the eval set
+    and pick the champion under CHAMPION_POLICY. Returns (candidate index, estimator, benchmark).
+    """
+    finalists = select_finalists(search)
+    print(f"Benchmarking {len(finalists)} finalists: {', '.join(finalists)}")
+    scored = []
+    for family, index in finalists.items():
+        if index == search.best_index_:
+            estimator = search.best_estimator_
+        else:
+            params = search.cv_results_['params'][index]
+            estimator = clone(pipeline).set_params(memory=None, **clone(params, safe=False)).fit(X_train, y_train_encoded)
+        
+        eval_f1 = f1_score(y_eval, label_encoder.inverse_transform(estimator.predict(X_eval)), average='weighted')
+        benchmark = log_benchmark(estimator, X_eval, label_encoder, prefix=f"finalist_{family}_")
+        mlflow.log_metric(f"finalist_{family}_eval_f1", float(eval_f1))
+        score = champion_score(eval_f1, benchmark['single_p99_ms'])
+        print(f"  {family}: eval_f1 {eval_f1:.4f}, p50/p99 {benchmark['single_p50_ms']:.2f}/{benchmark['single_p99_ms']:.2f} ms "
+              f"per row, batch p99 {benchmark['batch_p99_ms']:.1f} ms, peak {benchmark['batch_peak_memory_mb']:.1f} MB, "
+              f"size {benchmark['model_size_mb']:.2f} MB")
+        scored.append((index, estimator, benchmark, score))
+    
+    if CHAMPION_POLICY == 'f1':
+        # The search's own pick: selection stays on cross-validation scores
+        champion = next(entry for entry in scored if entry[0] == search.best_index_)
+    else:
+        eligible = [entry for entry in scored if entry[3] is not None]
+        if eligible:
+            champion = max(eligible, key=lambda entry: entry[3])
+        else:
+            print(f"No finalist has a p99 latency within {LATENCY_BUDGET_MS} ms; keeping the fastest")
+            champion = min(scored, key=lambda entry: entry[2]['single_p99_ms'])
+    index, estimator, benchmark, _ = champion
+    print(f"Champion ({CHAMPION_POLICY} policy): {classifier_family(search.cv_results_['params'][index]['classifier'])}")
+    return index, estimator, benchmark
+
+def create_search(pipeline, param_grid, strategy=SEARCH_STRATEGY, n_jobs=-1):
+    """Hyperparameter search engine selected by SEARCH_STRATEGY (same scoring and CV for both)"""
+    if strategy == 'grid' and SEARCH_CHECKPOINT_DIR:
+        return CheckpointedGridSearch(
+            pipeline,
+            param_grid,
+            scoring='f1_weighted',
+            cv=CV_FOLDS,
+            n_jobs=n_jobs,
+            checkpoint_dir=SEARCH_CHECKPOINT_DIR
+        )
+    if strategy == 'grid':
+        return GridSearchCV(
+            pipeline,
+            param_grid,
+            scoring='f1_weighted',  # Use weighted F1 score for evaluation
+            cv=CV_FOLDS,  # Use 3-fold cross-validation for faster computation
+            n_jobs=n_jobs,  # Outer worker processes (see plan_parallelism)
+            verbose=1  # Show progress
+        )
+    if strategy == 'halving':
+        # Subsets are drawn stratified on the labels; 'exhaust' sizes the first round
+        # so that the last one uses the whole training set
+        return StratifiedHalvingGridSearchCV(
+            pipeline,
+            param_grid,
+            scoring='f1_weighted',
+            cv=CV_FOLDS,
+            factor=HALVING_FACTOR,
+            resource='n_samples',
+            min_resources='exhaust',
+            random_state=42,
+            n_jobs=n_jobs,
+            verbose=1
+        )
+    raise ValueError(f"Unknown SEARCH_STRATEGY '{strategy}' (expected 'grid' or 'halving')")
+
 def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid, X_eval, y_eval):
     """Train models using GridSearchCV"""
     print("Starting GridSearchCV training...")
@@ -167,19 +424,50 @@ def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid
     y_test_encoded = label_encoder.transform(y_test)
     y_eval_encoded = label_encoder.transform(y_eval)  # added for eval
     
+    # Split the CPUs between candidate x fold processes and threads inside each fit,
+    # so the search neither oversubscribes nor leaves cores idle
+    plan = plan_parallelism(len(ParameterGrid(param_grid)) * CV_FOLDS)
+    set_inner_threads(param_grid, plan['inner_threads'])
+    print(f"CPU plan: {plan['n_cpus']} CPUs, {plan['n_tasks']} fits -> "
+          f"{plan['outer_jobs']} processes x {plan['inner_threads']} threads")
+    
+    # Cache fitted vectorizers (and their sparse outputs) on disk for the search: each
+    # vectorizer configuration is fitted once per fold and shared by all classifier
+    # candidates, also across the worker processes
+    cache_dir = tempfile.mkdtemp(prefix='vectorizer_cache_', dir=TRAINING_CACHE_DIR)
+    pipeline.set_params(memory=Memory(cache_dir, verbose=0))
+    
     # Perform grid search with weighted F1 score
-    grid_search = GridSearchCV(
-        pipeline,
-        param_grid,
-        scoring='f1_weighted',  # Use weighted F1 score for evaluation
-        cv=3,  # Use 3-fold cross-validation for faster computation
-        n_jobs=-1,  # Use all available CPU cores
-        verbose=1  # Show progress
-    )
+    grid_search = create_search(pipeline, param_grid, n_jobs=plan['outer_jobs'])
+    print(f"Search strategy: {SEARCH_STRATEGY}")
     
     # Fit the grid search
     print("Fitting GridSearchCV...")
-    grid_search.fit(X_train, y_train_encoded)
+    cpu_usage = CpuUtilization(plan['n_cpus']).start()
+    try:
+        with limit_inner_threads(plan['inner_threads']):
+            grid_search.fit(X_train, y_train_encoded)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    cpu_utilization = cpu_usage.stop()
+    print(f"Search took {cpu_usage.wall_seconds:.1f}s at {cpu_utilization:.0%} CPU utilization")
+    # The cache is gone; the saved model must not point at it
+    grid_search.best_estimator_.set_params(memory=None)
+    
+    mlflow.log_param("search_strategy", SEARCH_STRATEGY)
+    mlflow.log_params({
+        "n_cpus": plan['n_cpus'],
+        "outer_jobs": plan['outer_jobs'],
+        "inner_threads": plan['inner_threads']
+    })
+    mlflow.log_metrics({
+        "search_seconds": cpu_usage.wall_seconds,
+        "cpu_utilization": cpu_utilization
+    })
+    if SEARCH_STRATEGY == 'halving':
+        print(f"Successive halving: {grid_search.n_candidates_} candidates on {grid_search.n_resources_} samples per round")
+        mlflow.log_param("halving_candidates_per_round", grid_search.n_candidates_)
+        mlflow.log_param("halving_samples_per_round", grid_search.n_resources_)
     
     # Print results
     print("=" * 60)
@@ -187,16 +475,47 @@ def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid
     print("=" * 60)
     print("Best Parameters:", grid_search.best_params_)
     print("Best Cross-Validation Score:", grid_search.best_score_)
+    
+    # Pick the model to ship from the best candidate of each classifier family
+    champion_index, champion, benchmark = select_champion(
+        grid_search, pipeline, X_train, y_train_encoded, X_eval, y_eval, label_encoder
+    )
+    champion_params = grid_search.cv_results_['params'][champion_index]
+    champion_cv_score = float(grid_search.cv_results_['mean_test_score'][champion_index])
+    mlflow.log_param("champion_policy", CHAMPION_POLICY)
+    # The search candidate's own CV score, also when the registered model is its pruned refit
+    mlflow.log_metric("search_cv_score", champion_cv_score)
+    cv_score_source = 'search_cv'
+    
+    # Keep only the terms that carry class signal: smaller coefficient matrices and faster transforms
+    if VOCABULARY_PRUNING:
+        pruned, pruning_report = prune_vocabulary(champion, X_train, y_train_encoded, PRUNING_FRACTIONS, PRUNING_F1_TOLERANCE)
+        mlflow.log_metrics({f"pruning_{key}": value for key, value in pruning_report.items() if not isinstance(value, str)})
+        if pruned is not None:
+            print(f"Pruned vocabulary: {pruning_report['n_terms_before']} -> {pruning_report['n_terms_after']} terms")
+            champion = pruned
+            benchmark = log_benchmark(champion, X_eval, label_encoder, prefix="pruned_")
+            mlflow.log_dict({'vocabulary': champion.named_steps['vectorizer'].vocabulary}, "vocabulary.json")
+            # Params and validation score of the model that gets registered, not of the search candidate
+            champion_params = dict(champion_params, vectorizer__vocabulary="vocabulary.json")
+            if 'vectorizer__max_features' in champion_params:
+                champion_params['vectorizer__max_features'] = None
+            champion_cv_score = pruning_report['pruned_f1']
+            cv_score_source = 'pruning_holdout'
+        else:
+            print(f"Keeping the full vocabulary: {pruning_report['reason']}")
+    mlflow.log_param("cv_score_source", cv_score_source)
+    mlflow.log_metrics(benchmark)
 
             # Log hyperparameters
-    mlflow.log_params(grid_search.best_params_)
+    mlflow.log_params(champion_params)
     
     
     # Log the trained model
-    mlflow.sklearn.log_model(grid_search.best_estimator_, "model")
+    mlflow.sklearn.log_model(champion, "model")
     
     # Predict on the test set
-    y_test_pred_encoded = grid_search.best_estimator_.predict(X_test)
+    y_test_pred_encoded = champion.predict(X_test)
     y_test_pred = label_encoder.inverse_transform(y_test_pred_encoded)
     
     # Calculate test metrics
@@ -209,7 +528,7 @@ def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid
     print(classification_report(y_test, y_test_pred))
     
     # Predict on the evaluation set
-    y_eval_pred_encoded = grid_search.best_estimator_.predict(X_eval)
+    y_eval_pred_encoded = champion.predict(X_eval)
     y_eval_pred = label_encoder.inverse_transform(y_eval_pred_encoded)
 
     # Calculate eval metrics
@@ -225,22 +544,26 @@ def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid
     
     # Prepare results
     results = {
-        'best_params': grid_search.best_params_,
-        'best_cv_score': grid_search.best_score_,
+        'best_params': champion_params,
+        'best_cv_score': champion_cv_score,
         'test_f1_score': test_f1,
         'test_accuracy': test_accuracy,
         'eval_f1_score': eval_f1,
         'eval_accuracy': eval_accuracy,
         'label_encoder': label_encoder,
-        'best_estimator': grid_search.best_estimator_
+        'best_estimator': champion,
+        'benchmark': benchmark,
+        'vocabulary_size': len(getattr(champion.named_steps['vectorizer'], 'vocabulary_', ())),
+        'compiled_model': compile_serving_model(champion, label_encoder, X_eval, y_eval)
     }
             # Log performance metrics
     mlflow.log_metrics({
-        "cv_score": float(grid_search.best_score_),
+        "cv_score": champion_cv_score,
         "test_f1": float(test_f1),
         "test_accuracy": float(test_accuracy),
         "eval_f1": float(eval_f1),
         "eval_accuracy": float(eval_accuracy),
+        "vocabulary_size": results['vocabulary_size'],
         "n_samples": int(n_samples)
     })
     
@@ -249,7 +572,7 @@ def train_with_gridsearch(X_train, X_test, y_train, y_test, pipeline, param_grid
         statsd.incr("experiment_run_total")  # Increment total runs
         statsd.gauge("accuracy", test_accuracy)
         statsd.gauge("f1", test_f1)
-        statsd.gauge("cv", grid_search.best_score_)
+        statsd.gauge("cv", champion_cv_score)
     
     return results
 
@@ -262,19 +585,21 @@ def save_gridsearch_model(results, preprocessing_metadata, text_version='text_cl
     
     # Save best estimator (pipeline)
     model_path = os.path.join(MODELS_DIR, f'best_model_gridsearch_{timestamp}.pkl')
-    with open(model_path, 'wb') as f:
-        pickle.dump(results['best_estimator'], f)
+    model_sha = model_store.save_pickle(results['best_estimator'], model_path)
     
     # Save label encoder
     encoder_path = os.path.join(MODELS_DIR, f'label_encoder_{timestamp}.pkl')
-    with open(encoder_path, 'wb') as f:
-        pickle.dump(results['label_encoder'], f)
+    encoder_sha = model_store.save_pickle(results['label_encoder'], encoder_path)
+    # register_if_best_model links the champion files to these objects instead of pickling again
+    results['artifact_shas'] = {'model': model_sha, 'encoder': encoder_sha}
     
     # Create comprehensive metadata
     model_metadata = {
         'timestamp': timestamp,
         'model_path': model_path,
         'encoder_path': encoder_path,
+        'model_sha256': model_sha,
+        'encoder_sha256': encoder_sha,
         'model_type': 'gridsearch_best',
         'text_version_used': text_version,
         # 'best_params': results['best_params'],
@@ -285,7 +610,8 @@ def save_gridsearch_model(results, preprocessing_metadata, text_version='text_cl
         # },
         'training_approach': 'gridsearch_with_pipeline',
         'scoring_metric': 'f1_weighted',
-        'cv_folds': 3,
+        'cv_folds': CV_FOLDS,
+        'vocabulary_size': results.get('vocabulary_size'),
         'preprocessing_info': {
             'preprocessing_timestamp': preprocessing_metadata['timestamp'],
             'n_features_used': preprocessing_metadata['n_features'],
@@ -300,6 +626,11 @@ def save_gridsearch_model(results, preprocessing_metadata, text_version='text_cl
         metadata_for_json.pop('best_estimator', None)  # Remove the SVM model object
 
         json.dump(metadata_for_json, f, indent=2)
+    model_store.set_ref('latest', {
+        model_path: model_sha,
+        encoder_path: encoder_sha,
+        metadata_path: model_store.adopt(metadata_path)
+    })
     
     # Save as "latest" for easy access
     latest_model_path = os.path.join(MODELS_DIR, 'latest_gridsearch_model.json')
@@ -315,13 +646,25 @@ def save_gridsearch_model(results, preprocessing_metadata, text_version='text_cl
     
     return model_metadata
 
+def atomic_pickle_dump(obj, path):
+    """Pickle to a temp file and rename it into place, so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 def register_if_best_model(results, registered_model_name="TheBestModelTillNow"):
     """
-    Register model only if eval_f1 is better than current production model
+    Register model only if it scores better than the current production model under
+    CHAMPION_POLICY (eval_f1, within the latency budget, or F1 traded against p99 latency)
     """
     client = mlflow.tracking.MlflowClient()
     new_eval_f1 = results["eval_f1_score"]
     new_eval_accuracy = results["eval_accuracy"]
+    new_p99_ms = results["benchmark"]["single_p99_ms"]
+    new_score = champion_score(new_eval_f1, new_p99_ms)
 
     try:
         # Get latest production model
@@ -331,17 +674,23 @@ def register_if_best_model(results, registered_model_name="TheBestModelTillNow")
             current_run_id = current_model.run_id
             current_run = client.get_run(current_run_id)
             current_eval_f1 = float(current_run.data.metrics.get("eval_f1", 0.0))
-            print(f"Current registered eval_f1: {current_eval_f1:.4f}")
+            # Runs from before latency benchmarking count as instant
+            current_p99_ms = float(current_run.data.metrics.get("single_p99_ms", 0.0))
+            current_score = champion_score(current_eval_f1, current_p99_ms)
+            print(f"Current registered eval_f1: {current_eval_f1:.4f}, p99 latency: {current_p99_ms:.2f} ms")
         else:
-            current_eval_f1 = 0.0
+            current_score = None
             print("No production model registered yet.")
 
     except RestException:
         print(f"No registered model named '{registered_model_name}' found. Creating new one...")
-        current_eval_f1 = 0.0
+        current_score = None
 
-    if new_eval_f1 > current_eval_f1:
-        print(f"New model eval_f1 ({new_eval_f1:.4f}) is better. Registering model...")
+    print(f"New model eval_f1: {new_eval_f1:.4f}, p99 latency: {new_p99_ms:.2f} ms ({CHAMPION_POLICY} policy)")
+    if new_score is None:
+        print(f"New model p99 latency is over the {LATENCY_BUDGET_MS} ms budget. Not registering.")
+    elif current_score is None or new_score > current_score:
+        print("New model is better. Registering model...")
         model_uri = f"runs:/{mlflow.active_run().info.run_id}/model"
         result = mlflow.register_model(model_uri, registered_model_name)
 
@@ -358,6 +707,12 @@ def register_if_best_model(results, registered_model_name="TheBestModelTillNow")
             key="eval_accuracy",
             value=f"{new_eval_accuracy:.4f}"
         )
+        client.set_model_version_tag(
+            name=registered_model_name,
+            version=result.version,
+            key="single_p99_ms",
+            value=f"{new_p99_ms:.2f}"
+        )
         
         # Transition to production
         client.transition_model_version_stage(
@@ -371,16 +726,57 @@ def register_if_best_model(results, registered_model_name="TheBestModelTillNow")
         best_model_path = os.path.join(MODELS_DIR, 'the_best_model.pkl')
         best_encoder_path = os.path.join(MODELS_DIR, 'the_label_encoder.pkl')
         
-        with open(best_model_path, 'wb') as f_model:
-            pickle.dump(results['best_estimator'], f_model)
-
-        with open(best_encoder_path, 'wb') as f_enc:
-            pickle.dump(results['label_encoder'], f_enc)
+        best_compiled_path = os.path.join(MODELS_DIR, COMPILED_MODEL_FILENAME)
+        best_bundle_path = os.path.join(MODELS_DIR, MODEL_BUNDLE_FILENAME)
+        
+        # Encoder and compiled scorer first, model last: the API reloads when the model file changes.
+        # Each is a new hard link into the artifact store (an atomic replace, no extra copy)
+        shas = results.get('artifact_shas')
+        champion = {}
+        if shas:
+            model_store.link(shas['encoder'], best_encoder_path)
+            champion[best_encoder_path] = shas['encoder']
+        else:
+            champion[best_encoder_path] = model_store.save_pickle(results['label_encoder'], best_encoder_path)
+        if results.get('compiled_model') is not None:
+            save_linear_artifact(results['compiled_model'], best_compiled_path)
+            champion[best_compiled_path] = model_store.adopt(best_compiled_path)
+            print(f"Compiled linear scorer saved: {best_compiled_path}")
+        elif os.path.exists(best_compiled_path):
+            # Left over from an earlier linear champion, must not be served with this model
+            os.remove(best_compiled_path)
+        bundle_parts = {'pipeline': results['best_estimator'], 'label_encoder': results['label_encoder']}
+        if os.path.exists(CATEGORY_MAPPING_PATH):
+            with open(CATEGORY_MAPPING_PATH, 'r') as f:
+                bundle_parts['category_mapping'] = json.load(f)
+        champion.update(save_bundle(bundle_parts, best_bundle_path, compression=MODEL_BUNDLE_COMPRESSION))
+        if shas:
+            model_store.link(shas['model'], best_model_path)
+            champion[best_model_path] = shas['model']
+        else:
+            champion[best_model_path] = model_store.save_pickle(results['best_estimator'], best_model_path)
+        model_store.set_ref('champion', champion)
+        
+        if BENCHMARK_COLD_LOAD:
+            try:
+                cold_load = benchmark_cold_load(best_model_path, best_encoder_path, best_bundle_path)
+            except Exception as e:
+                print(f"Warning: cold-load benchmark failed: {e}")
+            else:
+                for fmt, measurements in cold_load.items():
+                    print(f"Cold load ({fmt}): {measurements['load_seconds']:.3f}s, "
+                          f"+{measurements['rss_anon_mb']:.1f} MB private, +{measurements['rss_file_mb']:.1f} MB file-backed")
+                    mlflow.log_metrics({f"cold_load_{fmt}_{key}": value for key, value in measurements.items()})
     else:
-        print(f"New model eval_f1 ({new_eval_f1:.4f}) is not better than current ({current_eval_f1:.4f}). Not registering.")
+        print(f"New model ({new_score:.4f}) is not better than current ({current_score:.4f}) under the {CHAMPION_POLICY} policy. Not registering.")
 
 def main():
     """Main training pipeline with GridSearchCV"""
+    if TRAINING_MODE == 'out_of_core':
+        # Imported here because online_training imports this module
+        from online_training import train_out_of_core
+        return train_out_of_core()
+    
     print("Starting GridSearchCV training pipeline...")
     print("Based on proven approach from previous project")
     print("=" * 60)
@@ -413,7 +809,7 @@ def main():
             model_metadata = save_gridsearch_model(results, preprocessing_metadata)
             
             # Step 7: Conditionally register model
-            register_if_best_model(results, model_metadata["model_path"])
+            register_if_best_model(results)
             
             print("=" * 60)
             print("TRAINING COMPLETED SUCCESSFULLY!")
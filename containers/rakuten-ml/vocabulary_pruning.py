@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Supervised vocabulary pruning for Rakuten model training
+Ranks the champion's vocabulary by chi-square against the categories and refits it on the
+smallest top-k vocabulary whose F1 stays within a tolerance of the full vocabulary
+"""
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_selection import chi2
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+def rank_terms(vectorizer, X, y):
+    """Vocabulary of a fitted vectorizer, most class-dependent terms (chi-square) first"""
+    scores, _ = chi2(vectorizer.transform(X), y)
+    order = np.argsort(-np.nan_to_num(scores), kind='stable')
+    return vectorizer.get_feature_names_out()[order]
+
+def prune_vocabulary(pipeline, X_train, y_train, fractions, tolerance, validation_size=0.2, random_state=42):
+    """
+    Smallest fraction of the vocabulary of a (vectorizer, classifier) pipeline that keeps
+    weighted F1 on a held-out part of the training set within tolerance of the full one.
+    Returns (pipeline refitted on X_train with the fixed vocabulary, report), or (None, report)
+    when the pipeline has no vocabulary or no fraction is good enough.
+    """
+    if not isinstance(pipeline.named_steps['vectorizer'], CountVectorizer):
+        return None, {'reason': 'vectorizer has no vocabulary'}
+
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=validation_size, stratify=y_train, random_state=random_state
+    )
+    baseline = clone(pipeline).fit(X_fit, y_fit)
+    baseline_f1 = f1_score(y_val, baseline.predict(X_val), average='weighted')
+    terms = rank_terms(baseline.named_steps['vectorizer'], X_fit, y_fit)
+    report = {'n_terms_before': len(terms), 'baseline_f1': float(baseline_f1)}
+    print(f"Vocabulary pruning: {len(terms)} terms, held-out F1 {baseline_f1:.4f}")
+
+    for fraction in sorted(fractions):
+        k = max(1, int(len(terms) * fraction))
+        if k >= len(terms):
+            break
+        # A fixed vocabulary ignores max_features/min_df/max_df; sorted keeps the column order stable
+        params = {'vectorizer__vocabulary': sorted(terms[:k]), 'vectorizer__max_features': None}
+        candidate = clone(pipeline).set_params(**params).fit(X_fit, y_fit)
+        pruned_f1 = f1_score(y_val, candidate.predict(X_val), average='weighted')
+        print(f"  top {k} terms: held-out F1 {pruned_f1:.4f}")
+        if pruned_f1 >= baseline_f1 - tolerance:
+            report.update({'n_terms_after': k, 'fraction': fraction, 'pruned_f1': float(pruned_f1)})
+            return clone(pipeline).set_params(**params).fit(X_train, y_train), report
+
+    report['reason'] = f'no fraction within {tolerance} F1'
+    return None, report
@@ -22,13 +22,15 @@ def check_conditions(**kwargs):
     eval_f1 = values['eval_f1']
     x_count = values['x_count']
 
+    # Full GridSearchCV retrain when quality drops or enough new rows piled up,
+    # otherwise a partial_fit update of the online model on the new rows only
     if eval_f1 >= 0.7:
         if x_count - n_samples >=10000:
-            return 'check_environment'
+            return 'run_training_docker'
         else:
-            return 'skip_task'
+            return 'run_online_training_docker'
     else:
-        return 'check_environment'
+        return 'run_training_docker'
     
 def check_directories():
     """Ensure required directories exist on host"""
@@ -70,7 +72,9 @@ with DAG(
     ## Tasks:
     1. **check_environment**: Verifies required directories exist
     2. **run_preprocessing_docker**: Runs preprocessing.py in ML Docker container
-    3. **run_training_docker**: Runs training.py in ML Docker container
+    3. **check_conditions**: Chooses a full retrain or an online update
+    4. **run_training_docker**: Runs training.py in ML Docker container
+       (or **run_online_training_docker**: partial_fit update with online_training.py)
     
     ## Benefits of Docker Approach:
     - Isolated ML environment with all dependencies
@@ -128,7 +132,9 @@ with DAG(
         ],
         environment={
             'PYTHONPATH': '/app',
-            'PYTHONUNBUFFERED': '1'
+            'PYTHONUNBUFFERED': '1',
+            # Trigger with conf {"full_rebuild": true} to reprocess every row
+            'PREPROCESSING_FULL_REBUILD': "{{ '1' if dag_run.conf.get('full_rebuild') else '0' }}"
         },
         auto_remove='success',
         mount_tmp_dir=False,
@@ -140,6 +146,8 @@ with DAG(
         - Connects to PostgreSQL via Docker network
         - Mounts volumes for data persistence
         - Processes French text and creates TF-IDF features
+        - Only rows above the stored id watermark are processed; trigger
+          with conf {"full_rebuild": true} to reprocess everything
         
         **Container Setup:**
         - Image: rakuten-ml:latest
@@ -161,7 +169,15 @@ with DAG(
         ],
         environment={
             'PYTHONPATH': '/app',
-            'PYTHONUNBUFFERED': '1'
+            'PYTHONUNBUFFERED': '1',
+            # 'grid' (exhaustive) or 'halving' (successive halving)
+            'SEARCH_STRATEGY': os.environ.get('SEARCH_STRATEGY', 'grid'),
+            # 'gridsearch' or 'out_of_core' (streamed hashing + SGD training)
+            'TRAINING_MODE': os.environ.get('TRAINING_MODE', 'gridsearch'),
+            # Promotion rule: 'f1', 'latency_budget' or 'f1_per_ms'
+            'CHAMPION_POLICY': os.environ.get('CHAMPION_POLICY', 'f1'),
+            'LATENCY_BUDGET_MS': os.environ.get('LATENCY_BUDGET_MS', '50'),
+            'F1_PER_MS': os.environ.get('F1_PER_MS', '0.001')
         },
         auto_remove='success',
         mount_tmp_dir=False,
@@ -181,11 +197,38 @@ with DAG(
         """
     )
     
-    skip_task = EmptyOperator(
-        task_id='skip_task',
+    # Task 2b: Online update between full retrains
+    online_training_docker = DockerOperator(
+        task_id='run_online_training_docker',
+        image='rakuten-ml:latest',  # Same ML container image
+        command='python scripts/online_training.py',
+        docker_url='unix://var/run/docker.sock',
+        network_mode='rakuten_project_default',  # Connect to your project's Docker network
+        mounts=[
+            Mount(source=f'{PROJECT_ROOT}/processed_data', target='/app/processed_data', type='bind'),
+            Mount(source=f'{PROJECT_ROOT}/models', target='/app/models', type='bind'),
+        ],
+        environment={
+            'PYTHONPATH': '/app',
+            'PYTHONUNBUFFERED': '1',
+            # Same promotion rule as full retrains
+            'CHAMPION_POLICY': os.environ.get('CHAMPION_POLICY', 'f1'),
+            'LATENCY_BUDGET_MS': os.environ.get('LATENCY_BUDGET_MS', '50'),
+            'F1_PER_MS': os.environ.get('F1_PER_MS', '0.001')
+        },
+        auto_remove='success',
+        mount_tmp_dir=False,
+        doc_md="""
+        ## Online Training Docker Task
+        
+        Runs online_training.py in the ML container:
+        - Hashing features + SGDClassifier, updated with partial_fit
+        - Only rows preprocessed since the last update are used
+        - Deployed only if it beats the production model on the eval set
+        """
     )
 
-    end = EmptyOperator(task_id='end')
+    end = EmptyOperator(task_id='end', trigger_rule='none_failed_min_one_success')
 
     # drift_detection = DockerOperator(
     #     task_id='drift_detection_docker',
@@ -216,6 +259,5 @@ with DAG(
     
     # Define task dependencies
     
-    read_metrics_task >> branch_task >> [environment_check, skip_task]
-    environment_check >> preprocessing_docker >> training_docker >> end
-    skip_task >> end
+    read_metrics_task >> environment_check >> preprocessing_docker >> branch_task
+    branch_task >> [training_docker, online_training_docker] >> end
@@ -0,0 +1,32 @@
+"""
+Gunicorn configuration for pre-forked multi-worker serving of the prediction API
+
+Usage: gunicorn -c gunicorn.conf.py main:app
+
+The app (and the model) is loaded once in the master process and workers are forked
+afterwards, so they share the model memory copy-on-write instead of each unpickling it.
+"""
+import gc
+import os
+
+# Workers already give process-level parallelism; skip the per-worker preprocessing pool
+os.environ.setdefault("PREPROCESS_WORKERS", "0")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# Import main.py (and the model) in the master before forking
+preload_app = True
+
+def when_ready(server):
+    from predict import model_holder
+    try:
+        snapshot = model_holder.get()
+        server.log.info(f"Model preloaded in master (version {snapshot.version})")
+    except Exception as e:
+        server.log.warning(f"Model not preloaded, workers will load it on first request: {e}")
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers do not write to (and thereby copy) the shared pages
+    gc.freeze()
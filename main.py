@@ -1,21 +1,38 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
 import logging
+import multiprocessing
+import os
 import mlflow
 import pandas as pd
 
 # Add ML container path to enable importing functions for prediction and public IP retrieval
 import sys
 sys.path.append('/app/containers/rakuten-ml')
-from predict import predict_single
+from predict import preprocess_items, score_preprocessed, model_holder, prediction_cache, in_flight_predictions
 from get_public_ip import get_public_ip
+from micro_batching import MicroBatcher
 
 # Set MLflow Tracking URI
 public_ip = get_public_ip()
 mlflow.set_tracking_uri("http://mlflow:5000")
 public_url = f"http://{public_ip}:5001"
 
+# Upper bound on items per /predict/batch call
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "50000"))
+
+# Micro-batching of concurrent /predict/ requests (set MICRO_BATCHING=0 to score each request alone)
+MICRO_BATCHING = os.environ.get("MICRO_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+# Inference runs off the event loop: sklearn scoring in threads, text normalization in processes
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "4"))
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", "2"))  # 0 = normalize in the inference threads
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -48,10 +65,86 @@ class PredictionResponse(BaseModel):
     model_id: str
     status: str
 
+class BatchPredictionItem(BaseModel):
+    title: str = ""
+    description: str = ""
+
+class BatchPredictionRequest(BaseModel):
+    items: List[BatchPredictionItem]
+    top_k: int = 3
+    model_id: str = None
+
 # ----------- Training State -----------
 
 training_status = {"is_training": False, "last_result": None}
 
+# ----------- Inference Executors -----------
+
+inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+preprocess_pool = None
+
+def _warm_up_worker():
+    return os.getpid()
+
+def start_preprocess_pool():
+    """Fork the normalization workers while the process is still single-threaded"""
+    global preprocess_pool
+    if PREPROCESS_WORKERS > 0 and preprocess_pool is None:
+        preprocess_pool = ProcessPoolExecutor(
+            max_workers=PREPROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("fork")
+        )
+        # Start every worker now instead of on the first request
+        for future in [preprocess_pool.submit(_warm_up_worker) for _ in range(PREPROCESS_WORKERS)]:
+            future.result()
+
+async def run_prediction(items, top_k=3):
+    """Preprocess and score (title, description) pairs without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+
+    # Identical payloads (e.g. a retried bulk import) are preprocessed and scored once
+    unique_items = list(dict.fromkeys(items))
+
+    if preprocess_pool is not None:
+        texts_classical = await loop.run_in_executor(preprocess_pool, preprocess_items, unique_items)
+    else:
+        texts_classical = await loop.run_in_executor(inference_pool, preprocess_items, unique_items)
+    unique_results = await loop.run_in_executor(inference_pool, score_preprocessed, texts_classical, top_k)
+
+    if len(unique_items) == len(items):
+        return unique_results
+    results_by_item = dict(zip(unique_items, unique_results))
+    return [results_by_item[item] for item in items]
+
+# ----------- Prediction Batching -----------
+
+# One batch in flight per inference thread, so batches overlap instead of queueing behind each other
+batcher = MicroBatcher(run_prediction, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       max_concurrency=INFERENCE_THREADS)
+
+# ----------- Startup -----------
+
+@app.on_event("startup")
+async def load_model():
+    # Load the model once up front so the first request does not pay for unpickling
+    try:
+        snapshot = model_holder.get()
+        logger.info(f"Model loaded at startup (version {snapshot.version})")
+    except Exception as e:
+        logger.warning(f"Model not available at startup, will retry on first prediction: {str(e)}")
+    start_preprocess_pool()
+    logger.info(f"Inference executors ready ({INFERENCE_THREADS} threads, {PREPROCESS_WORKERS} preprocessing processes)")
+    if MICRO_BATCHING:
+        batcher.start()
+        logger.info(f"Micro-batching enabled (max {BATCH_MAX_SIZE} items, {BATCH_MAX_WAIT_MS} ms window)")
+
+@app.on_event("shutdown")
+async def stop_inference():
+    await batcher.stop()
+    inference_pool.shutdown(wait=False)
+    if preprocess_pool is not None:
+        preprocess_pool.shutdown(wait=False)
+
 # ----------- API Routes -----------
 
 @app.get("/")
@@ -63,6 +156,7 @@ async def health_check():
     return {
         "status": "healthy",
         "training_active": training_status["is_training"],
+        "model_version": model_holder.version,
         "services": {
             "api": "running",
             "mlflow_tracking (internal)": mlflow.get_tracking_uri(),
@@ -140,8 +234,11 @@ async def make_prediction(request: PredictionRequest):
         
         logger.info(f"Making prediction for title: '{request.title}', description: '{request.description[:50]}...'")
         
-        # SIMPLE: Call the function directly instead of Docker subprocess
-        ml_response = predict_single(request.title, request.description)
+        # Concurrent requests are scored together; each caller still gets only its own result
+        if MICRO_BATCHING:
+            ml_response = await batcher.submit((request.title, request.description))
+        else:
+            ml_response = (await run_prediction([(request.title, request.description)]))[0]
         
         # Check for errors
         if "error" in ml_response:
@@ -164,6 +261,55 @@ async def make_prediction(request: PredictionRequest):
         logger.error(f"Prediction failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+@app.get("/predict/stats")
+async def get_batching_stats():
+    return {
+        "micro_batching": MICRO_BATCHING,
+        "batching": batcher.stats(),
+        "cache": prediction_cache.stats(),
+        "singleflight": in_flight_predictions.stats()
+    }
+
+@app.post("/predict/batch", response_model=PredictionResponse)
+async def make_batch_prediction(request: BatchPredictionRequest):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item must be provided")
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(request.items)} items (max {MAX_BATCH_SIZE})")
+    if request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be at least 1")
+
+    try:
+        logger.info(f"Making batch prediction for {len(request.items)} items")
+
+        # One preprocessing pass and one model call for the whole batch
+        ml_responses = await run_prediction(
+            [(item.title, item.description) for item in request.items],
+            top_k=request.top_k
+        )
+
+        # Items that could not be scored keep their error message, the rest of the batch still succeeds
+        formatted_predictions = []
+        for ml_response in ml_responses:
+            formatted_prediction = {
+                "category": ml_response["category"],
+                "confidence": ml_response["confidence"],
+                "top_3": ml_response["top_3"]
+            }
+            if "error" in ml_response:
+                formatted_prediction["error"] = ml_response["error"]
+            formatted_predictions.append(formatted_prediction)
+
+        return PredictionResponse(
+            predictions=formatted_predictions,
+            model_id=request.model_id or "rakuten_classifier",
+            status="success"
+        )
+
+    except Exception as e:
+        logger.error(f"Batch prediction failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
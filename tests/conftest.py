@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The ML scripts are plain modules in containers/rakuten-ml (scripts/ inside the container)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'containers', 'rakuten-ml'))
@@ -23,6 +23,21 @@ def test_training_status():
     print(f"Response: {response.json()}")
     return response.status_code == 200
 
+def test_batch_prediction():
+    """Test the batch prediction endpoint"""
+    print("\nTesting batch prediction endpoint...")
+    payload = {
+        "items": [
+            {"title": "Piscine Intex Prism", "description": "Piscine avec liner renforcé"},
+            {"title": "Harry Potter", "description": "Livre de poche en très bon état"},
+        ],
+        "top_k": 3
+    }
+    response = requests.post(f"{BASE_URL}/predict/batch", json=payload)
+    print(f"Status: {response.status_code}")
+    print(f"Response: {response.json()}")
+    return response.status_code == 200 and len(response.json()["predictions"]) == len(payload["items"])
+
 def main():
     """Run all tests"""
     print("=== Testing ML API ===")
@@ -30,6 +45,7 @@ def main():
     tests = [
         ("Health Check", test_health_check),
         ("Training Status", test_training_status),
+        ("Batch Prediction", test_batch_prediction),
         # Add more tests here as needed
     ]
     
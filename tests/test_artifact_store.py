@@ -0,0 +1,89 @@
+import os
+import time
+from datetime import datetime
+
+from artifact_store import ArtifactStore
+
+
+def _age(path, days):
+    old = time.time() - days * 86400
+    os.utime(path, (old, old))
+
+
+def test_relinking_same_object_leaves_no_tmp_files(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    target = tmp_path / 'the_label_encoder.pkl'
+
+    sha = store.save_bytes(b'encoder', str(target))
+    store.save_bytes(b'encoder', str(target))
+    store.link(sha, str(target))
+
+    assert sorted(os.listdir(tmp_path)) == ['.artifact_store', 'the_label_encoder.pkl']
+    assert os.stat(store.object_path(sha)).st_nlink == 2
+
+
+def test_identical_artifacts_share_one_object(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    first = store.save_pickle({'a': 1}, str(tmp_path / 'vectorizer_20260101_000000.pkl'))
+    second = store.save_pickle({'a': 1}, str(tmp_path / 'vectorizer_20260102_000000.pkl'))
+
+    assert first == second
+    assert os.path.samefile(tmp_path / 'vectorizer_20260101_000000.pkl', tmp_path / 'vectorizer_20260102_000000.pkl')
+
+
+def test_gc_removes_old_unreferenced_snapshots_and_their_objects(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    old_path = str(tmp_path / 'best_model_gridsearch_20260101_000000.pkl')
+    kept_path = str(tmp_path / 'best_model_gridsearch_20260102_000000.pkl')
+    champion_path = str(tmp_path / 'the_best_model.pkl')
+
+    old_sha = store.save_bytes(b'old model', old_path)
+    kept_sha = store.save_bytes(b'kept model', kept_path)
+    # Re-linking the champion twice must not add links that keep the object alive
+    store.link(old_sha, champion_path)
+    store.link(old_sha, champion_path)
+    store.set_ref('latest', {kept_path: kept_sha})
+    for path in (old_path, kept_path, store.object_path(old_sha), store.object_path(kept_sha)):
+        _age(path, 30)
+
+    removed_files, _, _ = store.collect_garbage(retention_days=7)
+    assert removed_files == 1
+    assert not os.path.exists(old_path)
+    assert os.path.exists(kept_path)
+    # The champion name still links the old object
+    assert os.path.exists(store.object_path(old_sha))
+
+    os.remove(champion_path)
+    _, removed_objects, _ = store.collect_garbage(retention_days=7)
+    assert removed_objects == 1
+    assert not os.path.exists(store.object_path(old_sha))
+    assert os.path.exists(store.object_path(kept_sha))
+
+
+def _now_stamp():
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def test_gc_keeps_recent_snapshots(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    path = str(tmp_path / f'X_features_{_now_stamp()}.npz')
+    store.save_bytes(b'features', path)
+
+    assert store.collect_garbage(retention_days=7) == (0, 0, 0)
+    assert os.path.exists(path)
+
+
+def test_gc_keeps_recent_snapshot_of_an_old_object(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    old_path = str(tmp_path / 'label_encoder_20260101_000000.pkl')
+    sha = store.save_bytes(b'encoder', old_path)
+    _age(store.object_path(sha), 30)
+
+    # Today's run stores the same encoder: its name links the month-old inode
+    new_path = str(tmp_path / f'label_encoder_{_now_stamp()}.pkl')
+    store.save_bytes(b'encoder', new_path)
+
+    removed_files, removed_objects, _ = store.collect_garbage(retention_days=7)
+    assert (removed_files, removed_objects) == (1, 0)
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
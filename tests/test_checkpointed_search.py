@@ -0,0 +1,75 @@
+import glob
+import json
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from checkpointed_search import CheckpointedGridSearch
+
+WORDS = {0: ['chaise', 'table', 'bois'], 1: ['piscine', 'pompe', 'filtre'], 2: ['livre', 'roman', 'poche']}
+
+def _data():
+    texts, labels = [], []
+    for i in range(60):
+        label = i % 3
+        texts.append(' '.join(WORDS[label][(i + k) % 3] for k in range(4)) + f' ref{i}')
+        labels.append(label)
+    return pd.Series(texts), labels
+
+class FlakyLogisticRegression(LogisticRegression):
+    """Fails with C=10 while failing is set, like a fit that ran out of memory"""
+    failing = False
+
+    def fit(self, X, y, sample_weight=None):
+        if self.failing and self.C == 10.0:
+            raise MemoryError("out of memory")
+        return super().fit(X, y, sample_weight)
+
+def _search(checkpoint_dir, classifier=None):
+    classifier = classifier or LogisticRegression(max_iter=200)
+    pipeline = Pipeline([('vectorizer', TfidfVectorizer()), ('classifier', classifier)])
+    return CheckpointedGridSearch(pipeline, {'classifier__C': [0.1, 1.0, 10.0]}, cv=3,
+                                  checkpoint_dir=str(checkpoint_dir), verbose=0)
+
+def _records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_resume_only_fits_missing_folds(tmp_path):
+    X, y = _data()
+    first = _search(tmp_path).fit(X, y)
+    path, = glob.glob(str(tmp_path / '*.jsonl'))
+    records = _records(path)
+    assert len(records) == 9
+
+    # Keep four finished fits plus a line cut short by a crash
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records[:4])
+        f.write('{"params_hash": "')
+    resumed = _search(tmp_path).fit(X, y)
+
+    # The torn line is dropped and only the five missing fits ran again
+    appended = _records(path)[4:]
+    assert len(appended) == 5
+    assert {(r['params_hash'], r['fold']) for r in appended}.isdisjoint(
+        (r['params_hash'], r['fold']) for r in records[:4])
+    assert resumed.best_params_ == first.best_params_
+    assert resumed.best_score_ == first.best_score_
+
+def test_resume_retries_failed_fits(tmp_path, monkeypatch):
+    X, y = _data()
+    monkeypatch.setattr(FlakyLogisticRegression, 'failing', True)
+    failed = _search(tmp_path, FlakyLogisticRegression(max_iter=200)).fit(X, y)
+    assert np.isnan(failed.cv_results_['mean_test_score'][2])
+
+    monkeypatch.setattr(FlakyLogisticRegression, 'failing', False)
+    resumed = _search(tmp_path, FlakyLogisticRegression(max_iter=200)).fit(X, y)
+
+    path, = glob.glob(str(tmp_path / '*.jsonl'))
+    records = _records(path)
+    # Six fits restored, the three failed folds ran again
+    assert [r['status'] for r in records] == ['ok'] * 6 + ['failed'] * 3 + ['ok'] * 3
+    assert not np.isnan(resumed.cv_results_['mean_test_score']).any()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.svm import LinearSVC
+
+from linear_scorer import LinearScorer, compile_linear_pipeline, save_linear_artifact
+
+WORDS = {
+    10: ['chaise', 'table', 'bois', 'jardin'],
+    40: ['piscine', 'pompe', 'filtre', 'eau'],
+    50: ['livre', 'roman', 'poche', 'édition'],
+}
+# Unknown terms, an empty text and repeated tokens on top of the training vocabulary
+EVAL_TEXTS = ['chaise bois bois', 'pompe piscine hors sol', '', 'roman édition poche livre', 'inconnu']
+
+def _data(labels=(10, 40, 50)):
+    texts, y = [], []
+    for i in range(90):
+        label = labels[i % len(labels)]
+        texts.append(' '.join(WORDS[label][(i + k) % 4] for k in range(3)) + f" ref{i % 7}")
+        y.append(label)
+    return texts, np.array(y)
+
+def _fit(vectorizer, classifier, labels=(10, 40, 50)):
+    texts, y = _data(labels)
+    codes = np.array(sorted(set(y)))
+    pipeline = Pipeline([('vectorizer', vectorizer), ('classifier', classifier)])
+    return pipeline.fit(texts, np.searchsorted(codes, y)), codes
+
+@pytest.mark.parametrize('vectorizer, classifier, labels', [
+    (TfidfVectorizer(ngram_range=(1, 2)), LogisticRegression(max_iter=500), (10, 40, 50)),
+    (TfidfVectorizer(sublinear_tf=True), LogisticRegression(max_iter=500), (10, 40)),
+    (CountVectorizer(), LogisticRegression(max_iter=500), (10, 40, 50)),
+    (TfidfVectorizer(), CalibratedClassifierCV(LinearSVC(), method='sigmoid', cv=3), (10, 40, 50)),
+])
+def test_compiled_scorer_matches_pipeline(vectorizer, classifier, labels):
+    pipeline, codes = _fit(vectorizer, classifier, labels)
+    compiled = compile_linear_pipeline(pipeline, codes)
+    assert compiled is not None
+
+    scorer = LinearScorer(compiled)
+    np.testing.assert_allclose(scorer.predict_proba(EVAL_TEXTS), pipeline.predict_proba(EVAL_TEXTS), atol=1e-5)
+    np.testing.assert_array_equal(scorer.class_labels, codes)
+
+def test_saved_artifact_matches_pipeline(tmp_path):
+    pipeline, codes = _fit(TfidfVectorizer(), LogisticRegression(max_iter=500))
+    path = str(tmp_path / 'model_linear.npz')
+    save_linear_artifact(compile_linear_pipeline(pipeline, codes), path)
+
+    np.testing.assert_allclose(LinearScorer.load(path).predict_proba(EVAL_TEXTS), pipeline.predict_proba(EVAL_TEXTS), atol=1e-5)
+
+def test_non_linear_pipeline_is_not_compiled():
+    pipeline, codes = _fit(TfidfVectorizer(), RandomForestClassifier(n_estimators=5, random_state=0))
+    assert compile_linear_pipeline(pipeline, codes) is None
@@ -0,0 +1,37 @@
+import pickle
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder
+
+from linear_scorer import compile_linear_pipeline, save_linear_artifact
+from predict import ModelHolder
+
+TEXTS = ['chaise bois jardin', 'table bois', 'piscine pompe', 'filtre piscine eau']
+CODES = [10, 10, 40, 40]
+
+def _fit(C):
+    label_encoder = LabelEncoder().fit(CODES)
+    pipeline = Pipeline([('vectorizer', TfidfVectorizer()), ('classifier', LogisticRegression(C=C))])
+    return pipeline.fit(TEXTS, label_encoder.transform(CODES)), label_encoder
+
+def test_new_compiled_scorer_gets_a_new_version_before_the_pickle_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model_path, encoder_path, compiled_path = 'model.pkl', 'encoder.pkl', 'model_linear.npz'
+    pipeline, label_encoder = _fit(C=1.0)
+    for obj, path in ((pipeline, model_path), (label_encoder, encoder_path)):
+        with open(path, 'wb') as f:
+            pickle.dump(obj, f)
+    holder = ModelHolder(model_path, encoder_path, compiled_path=compiled_path,
+                         bundle_path='missing_bundle.json', check_interval=0)
+    first = holder.get()
+
+    # Training writes the new compiled scorer first; the pickle is only replaced after it
+    new_pipeline, _ = _fit(C=100.0)
+    save_linear_artifact(compile_linear_pipeline(new_pipeline, label_encoder.classes_), compiled_path)
+    second = holder.get()
+
+    assert second.version != first.version
+    np.testing.assert_allclose(second.model.predict_proba(TEXTS), new_pipeline.predict_proba(TEXTS), atol=1e-5)
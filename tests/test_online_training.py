@@ -0,0 +1,66 @@
+import importlib
+import json
+import os
+
+import pandas as pd
+import pytest
+
+mlflow = pytest.importorskip('mlflow')
+pytest.importorskip('xgboost')
+
+from processed_text_store import write_parquet_part
+
+WORDS = {10: ['chaise', 'table', 'bois'], 40: ['piscine', 'pompe', 'filtre'], 50: ['livre', 'roman', 'poche']}
+
+def _frame(ids):
+    codes = list(WORDS)
+    rows = []
+    for i in ids:
+        code = codes[i % len(codes)]
+        text = ' '.join(WORDS[code][(i + k) % 3] for k in range(3)) + f' ref{i % 11}'
+        rows.append({'id': i, 'text_raw': text, 'text_classical': text, 'text_bert': text, 'prdtypecode': code})
+    return pd.DataFrame(rows)
+
+def _write_dataset(name, ids):
+    text_path = os.path.join('processed_data', name)
+    os.makedirs(text_path)
+    part = os.path.join(text_path, 'part-0.parquet')
+    df = _frame(ids)
+    write_parquet_part([df], part)
+    distribution = {str(code): int(count) for code, count in df['prdtypecode'].value_counts().items()}
+    return {'text_path': text_path, 'text_parts': [part], 'data_info': {'category_distribution': distribution}}
+
+@pytest.fixture
+def online_training(tmp_path, monkeypatch):
+    """online_training against a local tracking store and a small processed dataset in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    mlflow.set_tracking_uri((tmp_path / "mlruns").as_uri())
+    # training.py points MLflow at the compose service when it is imported
+    monkeypatch.setattr(mlflow, 'set_tracking_uri', lambda uri: None)
+    module = importlib.import_module('online_training')
+    mlflow.set_experiment("RakutenTraining")
+    # The tracking server answers a missing model with a RestException, a file store does not
+    mlflow.tracking.MlflowClient().create_registered_model("TheBestModelTillNow")
+
+    os.makedirs('models')
+    os.makedirs('processed_data')
+    with open(os.path.join('processed_data', 'latest_preprocessing.json'), 'w') as f:
+        json.dump(_write_dataset('train', range(1, 301)), f)
+    with open(os.path.join('processed_data', 'preprocessing_metadata_test.json'), 'w') as f:
+        json.dump(_write_dataset('test', range(1001, 1061)), f)
+    return module
+
+def test_online_update_registers_a_model(online_training):
+    state = online_training.main()
+
+    assert state['n_trained'] == 300
+    assert os.path.exists(os.path.join('models', 'the_best_model.pkl'))
+    # Nothing new: the next update is a no-op
+    assert online_training.main() is None
+
+def test_out_of_core_training_registers_a_model(online_training):
+    results = online_training.train_out_of_core()
+
+    assert results['eval_f1_score'] > 0.5
+    assert results['benchmark']['single_p99_ms'] > 0
+    assert os.path.exists(os.path.join('models', 'the_best_model.pkl'))
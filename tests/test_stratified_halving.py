@@ -0,0 +1,40 @@
+from collections import Counter
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+
+from stratified_halving import StratifiedHalvingGridSearchCV, StratifiedSubsampleSplitter
+
+def _imbalanced(seed=0):
+    y = np.array([0] * 900 + [1] * 90 + [2] * 10)
+    X = np.random.default_rng(seed).normal(size=(len(y), 4)) + y[:, None]
+    return X, y
+
+def test_subsets_keep_the_class_proportions():
+    X, y = _imbalanced()
+    splitter = StratifiedSubsampleSplitter(StratifiedKFold(n_splits=3), fraction=0.1, random_state=42)
+
+    for train, test in splitter.split(X, y):
+        counts = Counter(y[train].tolist())
+        assert len(train) == 66
+        # A plain random draw of 66 rows misses the 1% class about half the time
+        assert counts == {0: 59, 1: 6, 2: 1}
+        assert len(test) == 33 and Counter(y[test].tolist())[1] == 3
+
+def test_search_runs_every_round_on_stratified_subsets(monkeypatch):
+    X, y = _imbalanced()
+    fractions = []
+    split = StratifiedSubsampleSplitter.split
+    def recording_split(self, X, y, *args, **kwargs):
+        fractions.append(self.fraction)
+        return split(self, X, y, *args, **kwargs)
+    monkeypatch.setattr(StratifiedSubsampleSplitter, 'split', recording_split)
+
+    search = StratifiedHalvingGridSearchCV(
+        LogisticRegression(max_iter=200), {'C': [0.001, 0.01, 0.1, 1, 10, 100, 1000, 3, 30]},
+        cv=3, factor=3, min_resources='exhaust', scoring='f1_weighted', random_state=42
+    ).fit(X, y)
+
+    assert search.n_resources_ == [111, 333, 999]
+    assert fractions == [n / len(y) for n in search.n_resources_]